@@ -1,17 +1,24 @@
 import os
 import json
 import re
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# One pooled HTTP client shared by every completion in the process
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+        max_connections=int(os.getenv("RECAP_LLM_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("RECAP_LLM_KEEPALIVE_CONNECTIONS", "20")),
+    )),
+)
 
-history = [
-    {
-        "role": "system",
-        "content":
-            """You are an English tutor helping students practice English. Rules:
+system_message = {
+    "role": "system",
+    "content":
+        """You are an English tutor helping students practice English. Rules:
             1. ALWAYS speak in English only
             2. Keep responses under 15 words
             3. Focus on vocabulary building and conversation
@@ -22,11 +29,14 @@ history = [
             8. Always use new English speaker-friendly language
             
             Start with a warm greeting and ask what they'd like to practice."""
-    }
-]
+}
 
 
-def judge(ai_message: str, user_reply: str) -> dict:
+def new_history():
+    return [dict(system_message)]
+
+
+async def judge(ai_message: str, user_reply: str) -> dict:
     prompt = f"""
 You are an English language evaluator helping assess a student's English ability based on their interaction with an AI \
 assistant.
@@ -46,7 +56,7 @@ User replied:
 \"\"\"{user_reply}\"\"\"
 """
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o",
         messages=[{"role": "user", "content": prompt}],
         temperature=0
@@ -56,6 +66,78 @@ User replied:
     return extract_json(raw)
 
 
+def tutor_prompt(highlighted_words):
+    if highlighted_words:
+        cue_str = ", ".join(highlighted_words)
+        return (
+            "You are an educational assistant helping a student improve their English. "
+            f"The student is currently focusing on these important vocabulary words or morphemes: {cue_str}. "
+            "Make a strong effort to use these words in your responses. "
+            "If the student's message isn't directly related to these words, find a way to connect the conversation to \
+            them through examples, associations, or transitions."
+            "Encourage the student to use them in context."
+            "Do not ask students what topic they want. You decide what to study next."
+        )
+    return (
+        "You are an educational assistant helping a student improve their English. "
+        "The student hasn’t selected specific vocabulary topics yet. "
+        "Come up with a set of useful and engaging vocabulary themes (e.g., food, hobbies, travel, emotions) "
+        "and guide the conversation naturally to introduce and reinforce those words. "
+        "Encourage the student to use them in context as they respond."
+        "Do not ask students what topic they want. You decide what to study next."
+    )
+
+
+async def reply(history, highlighted_words):
+    full_messages = [{"role": "system", "content": tutor_prompt(highlighted_words)}] + history
+
+    response = await client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=full_messages,
+        temperature=0.7
+    )
+
+    return response.choices[0].message.content
+
+
+async def stream_reply(history, highlighted_words):
+    """Yield completion chunks as they arrive; the last chunk has no choices and carries the usage."""
+    full_messages = [{"role": "system", "content": tutor_prompt(highlighted_words)}] + history
+
+    stream = await client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=full_messages,
+        temperature=0.7,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    async for chunk in stream:
+        yield chunk
+
+
+async def summarize(summary, messages):
+    """Extend a running conversation summary with the messages that follow it."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = (
+        "You maintain a running summary of an English tutoring conversation. "
+        "Update the summary with the new messages. Keep the topics discussed, the vocabulary practised "
+        "and anything the student struggled with. Reply with the updated summary only, at most 150 words.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+
+    response = await client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+async def close():
+    await client.close()
+
+
 def extract_json(raw_text):
     match = re.search(r'\{.*?\}', raw_text, re.DOTALL)
     if match:
@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+import article_memory
+import metrics
+from storage import safe_id
+
+
+class ArticleLibrary:
+    """One article memory graph per document of a learner.
+
+    Engines are loaded on first use and kept in LRU order; beyond
+    ``max_loaded`` the least recently used idle engine is snapshotted and
+    dropped. ``due_index`` remembers the earliest time_next of every
+    document so the cross-document due query only loads documents that
+    actually have something due. A document whose time is unknown (None
+    in an index left behind by a crash) is loaded once to find out.
+    """
+
+    def __init__(self, directory, max_loaded=8):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.index_path = os.path.join(directory, "due_index.json")
+        self.engines = OrderedDict()
+        self.pins = {}
+        self.removed = set()  # removed while pinned: deleted when the last user lets go
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.due_index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.due_index = json.load(f)
+        self.unknown = {document_id for document_id, t in self.due_index.items() if t is None}
+
+    def path(self, document_id):
+        return os.path.join(self.directory, safe_id(document_id))
+
+    def documents(self):
+        return sorted(set(self.due_index) | set(self.engines))
+
+    def __contains__(self, document_id):
+        return document_id in self.engines or document_id in self.due_index
+
+    @contextmanager
+    def open(self, document_id):
+        """Engine of ``document_id``; it is not evicted while the block runs."""
+        with self.lock:
+            engine = self.engines.get(document_id)
+            if engine is None:
+                engine = article_memory.new_engine(self.path(document_id))
+                self.engines[document_id] = engine
+                metrics.incr("articles.loaded")
+                if document_id not in self.due_index:
+                    # index new documents right away so a crash cannot hide them
+                    self.due_index[document_id] = None
+                    self._save_index()
+            else:
+                self.engines.move_to_end(document_id)
+            self.pins[document_id] = self.pins.get(document_id, 0) + 1
+            self._evict()
+        try:
+            yield engine
+        finally:
+            with self.lock:
+                self.pins[document_id] -= 1
+                if not self.pins[document_id]:
+                    del self.pins[document_id]
+                if self.engines.get(document_id) is not engine:
+                    # removed while the block ran
+                    if document_id in self.removed and document_id not in self.pins:
+                        self.removed.discard(document_id)
+                        engine.close()
+                        shutil.rmtree(self.path(document_id), ignore_errors=True)
+                else:
+                    self.unknown.discard(document_id)
+                    earliest = engine.next_due()
+                    created = self.due_index.get(document_id) is None and earliest is not None
+                    self.due_index[document_id] = earliest
+                    if created:
+                        # the graph was just built: persist it so a crash cannot hide it from due()
+                        self._save_index()
+
+    def remove(self, document_id):
+        """Forget ``document_id``: drop its engine, its directory and its due_index entry."""
+        with self.lock:
+            engine = self.engines.pop(document_id, None)
+            if self.pins.get(document_id):
+                # still in use: open() deletes it once the last block exits
+                self.removed.add(document_id)
+            else:
+                if engine is not None:
+                    engine.close()
+                shutil.rmtree(self.path(document_id), ignore_errors=True)
+            self.unknown.discard(document_id)
+            if document_id in self.due_index:
+                del self.due_index[document_id]
+                self._save_index()
+
+    def _evict(self):
+        evicted = False
+        for document_id in list(self.engines):
+            if len(self.engines) <= self.max_loaded:
+                break
+            if self.pins.get(document_id):
+                continue
+            engine = self.engines.pop(document_id)
+            self.due_index[document_id] = engine.next_due()
+            engine.close()
+            evicted = True
+            metrics.incr("articles.evicted")
+        if evicted:
+            self._save_index()
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.due_index, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def earliest(self):
+        """document_id -> earliest time_next, None for an empty graph."""
+        with self.lock:
+            for document_id, engine in self.engines.items():
+                self.due_index[document_id] = engine.next_due()
+            return dict(self.due_index)
+
+    def due(self, now=None, limit=10):
+        """The ``limit`` earliest due (time_next, document_id, item, depth) across all documents.
+
+        Documents are visited in order of their earliest due node, and the
+        walk stops as soon as the next document cannot beat the current
+        ``limit``-th entry, so only documents that contribute are loaded.
+        """
+        now = time.time() if now is None else now
+        for document_id in list(self.unknown):
+            with self.open(document_id):
+                pass
+        candidates = sorted((t, d) for d, t in self.earliest().items() if t is not None and t < now)
+        result = []
+        for earliest, document_id in candidates:
+            if len(result) >= limit and earliest >= result[-1][0]:
+                break
+            with self.open(document_id) as engine:
+                due = ((t, document_id, item, depth) for t, item, depth in engine.due(range(4), now))
+                result = list(itertools.islice(heapq.merge(result, itertools.islice(due, limit)), limit))
+        return result
+
+    @property
+    def nbytes(self):
+        return sum(engine.nodes.nbytes for engine in self.engines.values())
+
+    @property
+    def node_count(self):
+        return sum(len(table) for engine in self.engines.values() for table in engine.nodes)
+
+    def close(self):
+        with self.lock:
+            for document_id, engine in self.engines.items():
+                self.due_index[document_id] = engine.next_due()
+                engine.close()
+            self.engines.clear()
+            self._save_index()
@@ -1,9 +1,15 @@
+import os
+import ast
 import time
 import math
 import agent
 import json
+import itertools
 from collections import defaultdict
-from sortedcontainers import SortedSet
+from engine import MemoryEngine
+from decomposition_cache import cache
+import metrics
+from chunking import chunk_text, map_chunks, dedup, dedup_key
 
 
 def merge_pairs(pairs):
@@ -13,109 +19,184 @@ def merge_pairs(pairs):
     return list(counter.items())
 
 
-def split_article(article_content):
+article_prompt = (
+    "You are a content analysis engine. Given an article, identify and extract the main sections or topics. "
+    "Return a Python list of strings, where each string is a concise title (3-8 words) representing a major section or topic in the article. "
+    "Focus on the main themes, not minor details. Aim for 3-8 sections maximum. "
+    "Example format: ['Introduction to AI', 'Machine Learning Basics', 'Deep Learning Applications', 'Future Challenges']"
+)
+
+section_prompt = (
+    "You are a knowledge extraction engine. Given a section title from an article, "
+    "identify the key concepts, terms, or ideas that would be important for a reader to understand and remember. "
+    "Return a Python list of strings, where each string is a specific concept, term, or key idea (1-4 words each). "
+    "Focus on concrete, memorable concepts rather than abstract ideas. Aim for 3-6 concepts per section. "
+    "Example: For 'Machine Learning Basics' → ['supervised learning', 'neural networks', 'training data', 'algorithms']"
+)
+
+concept_prompt = (
+    "You are a detail extraction engine. Given a concept or term, "
+    "identify specific details, facts, characteristics, or sub-components that help explain or define this concept. "
+    "Return a Python list of strings, where each string is a specific detail or fact (2-6 words each). "
+    "Focus on concrete, factual details rather than general descriptions. Aim for 2-5 details per concept. "
+    "Example: For 'neural networks' → ['interconnected nodes', 'weighted connections', 'activation functions', 'backpropagation']"
+)
+
+
+async def complete_list(system_prompt, user_message):
+    """调用模型并把返回结果解析为字符串列表，解析失败时抛出 ValueError"""
+    response = await agent.client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ],
+        temperature=0.3
+    )
+
+    raw = response.choices[0].message.content.strip()
+    try:
+        return [x for x in ast.literal_eval(raw) if isinstance(x, str)]
+    except (ValueError, SyntaxError, TypeError):
+        raise ValueError(f"无法解析模型返回的列表: {raw!r}")
+
+
+# 分解结果按（分解函数, 提示词版本, 规范化输入）缓存，相同的文章/章节/概念不再重复调用模型
+@cache.cached("split_article", article_prompt, "gpt-3.5-turbo", 0.3)
+async def extract_sections(content_preview):
+    return await complete_list(article_prompt, f"Article content: \"{content_preview}\"")
+
+
+@cache.cached("split_section", section_prompt, "gpt-3.5-turbo", 0.3)
+async def extract_concepts(section_title):
+    return await complete_list(section_prompt, f"Section title: \"{section_title}\"")
+
+
+@cache.cached("split_concept", concept_prompt, "gpt-3.5-turbo", 0.3)
+async def extract_details(concept):
+    return await complete_list(concept_prompt, f"Concept: \"{concept}\"")
+
+
+tree_prompt = (
+    "You are a knowledge extraction engine. Given an article, return its full knowledge tree in one JSON object: "
+    "the main sections (3-8, each a concise 3-8 word title), for each section its key concepts "
+    "(3-6, 1-4 words each), and for each concept its concrete details or facts (2-5, 2-6 words each). "
+    "Return only JSON in exactly this format: "
+    "{\"sections\": [{\"title\": \"...\", \"concepts\": [{\"name\": \"...\", \"details\": [\"...\"]}]}]}"
+)
+
+
+def validate_tree(data):
+    """检查模型返回的知识树结构，返回 [[章节, [[概念, [细节]]]]]，结构不对时抛出 ValueError"""
+    def items(value):
+        # 字符串也可迭代，不检查的话会被拆成单个字符
+        if not isinstance(value, list):
+            raise ValueError(f"应为列表: {value!r}")
+        return value
+
+    tree = []
+    for section in items(data["sections"]):
+        concepts = []
+        for concept in items(section["concepts"]):
+            details = [d.strip() for d in items(concept["details"]) if isinstance(d, str) and d.strip()]
+            if isinstance(concept["name"], str) and concept["name"].strip():
+                concepts.append([concept["name"].strip(), details])
+        if isinstance(section["title"], str) and section["title"].strip():
+            tree.append([section["title"].strip(), concepts])
+    if not tree:
+        raise ValueError("知识树中没有章节")
+    return tree
+
+
+@cache.cached("split_article_tree", tree_prompt, "gpt-3.5-turbo", 0.3)
+async def extract_tree(content_preview):
+    response = await agent.client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": tree_prompt},
+            {"role": "user", "content": f"Article content: \"{content_preview}\""}
+        ],
+        temperature=0.3,
+        response_format={"type": "json_object"}
+    )
+
+    raw = response.choices[0].message.content.strip()
+    try:
+        return validate_tree(json.loads(raw))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"无法解析模型返回的知识树: {e}")
+
+
+def weighted(children, depth):
+    """每个子节点平分父节点的权重"""
+    return [((child, depth), 1.0/len(children)) for child in children]
+
+
+def fallback_sections(article_content):
+    # 如果AI解析失败，使用简单的段落分割
+    paragraphs = [p.strip() for p in article_content.split('\n\n') if len(p.strip()) > 100]
+    sections = [f"Section {i+1}" for i in range(min(len(paragraphs), 6))]
+    return weighted(sections, 1)
+
+
+def fallback_concepts(section_title):
+    # 如果AI解析失败，使用基于标题的简单概念生成
+    words = section_title.lower().split()
+    key_words = [w for w in words if len(w) > 3 and w not in ['the', 'and', 'for', 'with', 'from']]
+    return [((word, 2), 1.0/len(key_words)) for word in key_words[:4]]
+
+
+def fallback_details(concept):
+    # 如果AI解析失败，使用基于概念的简单细节生成
+    words = concept.lower().split()
+    if len(words) > 1:
+        return [((word, 3), 0.5) for word in words if len(word) > 2]
+    else:
+        return [((f"{concept} definition", 3), 1.0)]
+
+
+def tree_decompositions(article_title, tree):
+    """把一次返回的整棵知识树转换成各节点的分解结果，权重与逐层分解相同"""
+    decompositions = {(article_title, 0): weighted([title for title, _ in tree], 1)}
+    for section_title, concepts in tree:
+        names = [name for name, _ in concepts]
+        decompositions[(section_title, 1)] = weighted(names, 2) if names else fallback_concepts(section_title)
+        for name, details in concepts:
+            decompositions[(name, 2)] = weighted(details, 3) if details else fallback_details(name)
+    return decompositions
+
+
+async def split_article(article_content):
     """
     第1层：将文章分解为主要章节/段落
     """
-    system_prompt = (
-        "You are a content analysis engine. Given an article, identify and extract the main sections or topics. "
-        "Return a Python list of strings, where each string is a concise title (3-8 words) representing a major section or topic in the article. "
-        "Focus on the main themes, not minor details. Aim for 3-8 sections maximum. "
-        "Example format: ['Introduction to AI', 'Machine Learning Basics', 'Deep Learning Applications', 'Future Challenges']"
-    )
-    
     # 限制内容长度避免token过多
     content_preview = article_content[:3000] if len(article_content) > 3000 else article_content
-    user_message = f"Article content: \"{content_preview}\""
 
     try:
-        response = agent.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.3
-        )
-
-        raw = response.choices[0].message.content.strip()
-        sections = eval(raw)
-        return [((section, 1), 1.0/len(sections)) for section in sections if isinstance(section, str)]
-    except:
-        # 如果AI解析失败，使用简单的段落分割
-        paragraphs = [p.strip() for p in article_content.split('\n\n') if len(p.strip()) > 100]
-        sections = [f"Section {i+1}" for i in range(min(len(paragraphs), 6))]
-        return [((section, 1), 1.0/len(sections)) for section in sections]
-
-
-def split_section(section_title):
+        return weighted(await extract_sections(content_preview), 1)
+    except Exception:
+        return fallback_sections(article_content)
+
+
+async def split_section(section_title):
     """
     第2层：将章节分解为核心概念
     """
-    system_prompt = (
-        "You are a knowledge extraction engine. Given a section title from an article, "
-        "identify the key concepts, terms, or ideas that would be important for a reader to understand and remember. "
-        "Return a Python list of strings, where each string is a specific concept, term, or key idea (1-4 words each). "
-        "Focus on concrete, memorable concepts rather than abstract ideas. Aim for 3-6 concepts per section. "
-        "Example: For 'Machine Learning Basics' → ['supervised learning', 'neural networks', 'training data', 'algorithms']"
-    )
-    
-    user_message = f"Section title: \"{section_title}\""
-
     try:
-        response = agent.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.3
-        )
-
-        raw = response.choices[0].message.content.strip()
-        concepts = eval(raw)
-        return [((concept, 2), 1.0/len(concepts)) for concept in concepts if isinstance(concept, str)]
-    except:
-        # 如果AI解析失败，使用基于标题的简单概念生成
-        words = section_title.lower().split()
-        key_words = [w for w in words if len(w) > 3 and w not in ['the', 'and', 'for', 'with', 'from']]
-        return [((word, 2), 1.0/len(key_words)) for word in key_words[:4]]
-
-
-def split_concept(concept):
+        return weighted(await extract_concepts(section_title), 2)
+    except Exception:
+        return fallback_concepts(section_title)
+
+
+async def split_concept(concept):
     """
     第3层：将概念分解为具体细节和要点
     """
-    system_prompt = (
-        "You are a detail extraction engine. Given a concept or term, "
-        "identify specific details, facts, characteristics, or sub-components that help explain or define this concept. "
-        "Return a Python list of strings, where each string is a specific detail or fact (2-6 words each). "
-        "Focus on concrete, factual details rather than general descriptions. Aim for 2-5 details per concept. "
-        "Example: For 'neural networks' → ['interconnected nodes', 'weighted connections', 'activation functions', 'backpropagation']"
-    )
-    
-    user_message = f"Concept: \"{concept}\""
-
     try:
-        response = agent.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.3
-        )
-
-        raw = response.choices[0].message.content.strip()
-        details = eval(raw)
-        return [((detail, 3), 1.0/len(details)) for detail in details if isinstance(detail, str)]
-    except:
-        # 如果AI解析失败，使用基于概念的简单细节生成
-        words = concept.lower().split()
-        if len(words) > 1:
-            return [((word, 3), 0.5) for word in words if len(word) > 2]
-        else:
-            return [((f"{concept} definition", 3), 1.0)]
+        return weighted(await extract_details(concept), 3)
+    except Exception:
+        return fallback_details(concept)
 
 
 def split_detail(detail):
@@ -125,157 +206,179 @@ def split_detail(detail):
     return []
 
 
-def update_ease_factor(ef, grade, sensitivity=1.5):
-    """更新难度因子"""
-    delta = sensitivity * (0.3 - (5 - grade) * (0.2 + (5 - grade) * 0.08))
-    ef += delta
-    return max(ef, 1.3)
-
-
 # 文章记忆系统的全局变量
 retention_threshold = 0.6
 decay_factor = math.log(2) / 300  # 文章记忆半衰期设为5分钟，比英语单词更长
-article_nodes = [{}, {}, {}, {}]
-article_history = []
-article_retention_queue = SortedSet()
 article_split_functions = [split_article, split_section, split_concept, split_detail]
 
 
-def new_article_node(item, depth):
-    """创建新的文章记忆节点"""
-    time_ = time.time()
-    retention = 1
-    ease_factor = 2.5
-    time_last = time_ + math.log(retention) * ease_factor / decay_factor
-    review_interval = - math.log(retention_threshold) * ease_factor / decay_factor
-    time_next = time_last + review_interval
-    article_retention_queue.add((time_next, (item, depth)))
-    
-    return {
-        "retention": retention,
-        "time": time_,
-        "time_last": time_last,
-        "time_next": time_next,
-        "decay_factor": decay_factor,
-        "ease_factor": ease_factor,
-        "review_interval": review_interval,
-        "next": article_split_functions[depth](item),
-        "history": {
-            time_: {
-                "time_last": time_last,
-                "ease_factor": ease_factor,
-            }
-        },
-    }
+# 构建知识图谱时同一层的节点并发分解，最多同时进行的模型调用数
+split_concurrency = int(os.getenv("RECAP_ARTICLE_SPLIT_CONCURRENCY", "8"))
+# 长文章的分块大小（字符数）和同时处理的分块数
+chunk_chars = int(os.getenv("RECAP_CHUNK_CHARS", "3000"))
+chunk_concurrency = int(os.getenv("RECAP_CHUNK_CONCURRENCY", "4"))
+# 合并各分块结果后整篇文章最多保留的章节数，以及每个章节最多保留的概念数
+max_sections = int(os.getenv("RECAP_MAX_SECTIONS", "8"))
+max_concepts = int(os.getenv("RECAP_MAX_CONCEPTS", "6"))
 
 
-def update_article_retention(item, depth):
-    """更新文章节点的记忆保持率"""
-    article_nodes[depth][item]["time"] = time.time()
-    time_ = article_nodes[depth][item]["time"]
-    time_last = article_nodes[depth][item]["time_last"]
-    decay_factor = article_nodes[depth][item]["decay_factor"]
-    ease_factor = article_nodes[depth][item]["ease_factor"]
-    article_nodes[depth][item]["retention"] = math.exp(-decay_factor / ease_factor * (time_ - time_last))
+consolidate_prompt = (
+    "You are a content analysis engine. Given section titles extracted from consecutive parts of one long article, "
+    "merge overlapping or closely related titles into the main sections of the whole article, in reading order. "
+    f"Return a Python list of at most {max_sections} strings, each a concise title (3-8 words)."
+)
 
 
-def update_article_node(item, grade, weight, depth):
-    """更新文章记忆节点"""
-    if item not in article_nodes[depth]:
-        article_nodes[depth][item] = new_article_node(item, depth)
-    
-    time_ = time.time()
-    time_last = article_nodes[depth][item]["time_last"] + (time_ - article_nodes[depth][item]["time_last"])
-    article_nodes[depth][item]["time_last"] = time_last
-    ease_factor = update_ease_factor(article_nodes[depth][item]["ease_factor"], grade)
-    article_nodes[depth][item]["ease_factor"] = ease_factor
-    article_nodes[depth][item]["history"][time_] = {
-        "time_last": time_last,
-        "ease_factor": ease_factor,
-    }
-    
-    decay_factor = article_nodes[depth][item]["decay_factor"]
-    time_next = article_nodes[depth][item]["time_next"]
-    article_retention_queue.discard((time_next, (item, depth)))
-    review_interval = - math.log(retention_threshold) * ease_factor / decay_factor
-    time_next = time_last + review_interval
-    article_nodes[depth][item]["review_interval"] = review_interval
-    article_nodes[depth][item]["time_next"] = time_next
-    article_retention_queue.add((time_next, (item, depth)))
-    update_article_retention(item, depth)
-
-
-def update_article_memory(item, grade, depth=0, weight=1):
-    """更新文章记忆系统"""
-    if depth == 0:  # 记录文章级别的学习历史
-        article_history.append((time.time(), item))
-    
-    update_article_node(item, grade, weight, depth)
-    
-    # 递归更新下层节点
-    if depth < 3:  # 只到第3层
-        for (item_next, depth_next), w in article_nodes[depth][item]["next"]:
-            update_article_memory(item_next, grade, depth_next, weight * w)
+@cache.cached("consolidate_sections", consolidate_prompt, "gpt-3.5-turbo", 0.3)
+async def extract_consolidated(titles):
+    return await complete_list(consolidate_prompt, "Section titles:\n" + titles)
+
+
+def spread(items, limit):
+    """最多 limit 个条目，在原顺序中均匀选取，保证覆盖文章的各个部分"""
+    if len(items) <= limit:
+        return items
+    return [items[i * len(items) // limit] for i in range(limit)]
+
+
+async def reduce_sections(titles):
+    """各分块的章节标题超过 max_sections 时调用一次模型合并，失败时均匀截取"""
+    if len(titles) <= max_sections:
+        return titles
+    metrics.incr("article_memory.section_reductions")
+    try:
+        reduced = dedup(await extract_consolidated("\n".join(titles)))
+    except Exception as e:
+        print("合并章节失败:", repr(e))
+        reduced = []
+    return spread(reduced or titles, max_sections)
 
 
-def update_all_article_retention():
-    """更新所有文章节点的记忆保持率"""
-    for depth in range(4):
-        for item in article_nodes[depth].keys():
-            update_article_retention(item, depth)
+def new_engine(directory=None):
+    """创建文章记忆引擎；文章级别的学习历史记录在第0层"""
+    return MemoryEngine(article_split_functions, decay_factor, retention_threshold, history_depth=0,
+                        directory=directory, expand_concurrency=split_concurrency)
 
 
-def query_article_memory():
-    """查询文章记忆状态"""
+def update_article_memory(engine, item, grade, depth=None, weight=1):
+    """复习评分：只沿已有子树传播，每个节点只更新一次，返回涉及的节点数
+
+    节点按 (depth, item) 定位，不传 depth 时取该条目所在的最浅一层；
+    节点不存在时抛出 KeyError，复习时绝不调用分解函数
+    """
+    if depth is None:
+        depth = engine.find(item)
+    # 逐层合并权重，同一节点无论从几条路径到达都只重新调度一次
+    return engine.update(item, grade, depth, weight, expand=False)
+
+
+def update_all_article_retention(engine, depth=None):
+    """按当前时间批量计算文章节点的记忆保持率（只读，不写回节点）"""
+    return engine.retention_at(time.time(), depth)
+
+
+def query_article_memory(engine):
+    """查询文章记忆状态（保持率在读取时按当前时间计算）"""
+    now = time.time()
     # 获取需要复习的概念（主要从第2层和第3层）
-    queue = [x[1][0] for x in article_retention_queue if
-             x[0] < time.time()
-             and x[1][1] in {1, 2}  # 章节层和概念层
-             and len(x[1][0]) > 2
-             ]
+    due = engine.due((1, 2), now)  # 章节层和概念层
+    queue = [item for _, item, _ in due if len(item) > 2]
     
     return {
-        "nodes": article_nodes,
+        "nodes": engine.to_dict(now),
         "retention_queue": queue
     }
 
 
-def create_article_knowledge_graph(article_content, article_title, document_id=None):
-    """为文章创建知识图谱"""
-    # 简化处理：使用全局变量，但添加检查避免重复创建
-    global article_nodes, article_history, article_retention_queue
-    
+async def create_article_knowledge_graph(engine, article_content, article_title, document_id=None,
+                                         mode="layered"):
+    """为文章创建知识图谱，返回图谱和每个分块的耗时
+
+    mode="layered" 逐层调用 split_article/split_section/split_concept；
+    mode="single" 一次调用让模型返回整棵 章节→概念→细节 树，适合中短篇文章
+    """
     # 如果已经存在内容，直接返回
-    if any(article_nodes[i] for i in range(4)):
-        return query_article_memory()
+    if any(engine.nodes[i] for i in range(4)):
+        return query_article_memory(engine), []
     
     # 重置文章记忆系统
-    article_nodes = [{}, {}, {}, {}]
-    article_history = []
-    article_retention_queue = SortedSet()
+    engine.reset()
     
-    # 创建文章根节点并开始分解
-    update_article_memory(article_title, 5)  # 初始评分为5（完全理解）
-    
-    return query_article_memory()
+    # 长文章按段落和标题切块，各块并行抽取后合并去重，而不是只看前3000字
+    chunks = chunk_text(article_content, chunk_chars)
+    decompositions = None
+    timings = []
+    if mode == "single":
+        trees, timings = await map_chunks(chunks, extract_tree, chunk_concurrency)
+        trees = [tree for tree in trees if tree]
+        if trees:
+            decompositions = tree_decompositions(article_title, merge_trees(trees))
+        else:
+            # 整棵树解析失败时退回逐层分解
+            print("单次抽取知识树失败，改为逐层分解")
+            metrics.incr("article_memory.tree_fallbacks")
+
+    if decompositions is None:
+        sections, timings = await map_chunks(chunks, extract_sections, chunk_concurrency)
+        titles = await reduce_sections(dedup([title for titles in sections if titles for title in titles]))
+        decompositions = {
+            (article_title, 0): weighted(titles, 1) if titles else fallback_sections(article_content)
+        }
+
+    # 创建文章根节点并开始分解，初始评分为5（完全理解）
+    await engine.review(article_title, 5, decompositions=decompositions)
+
+    return query_article_memory(engine), timings
+
+
+def merge_trees(trees):
+    """合并各分块的知识树：同名章节合并概念，同名概念合并细节
+
+    合并后章节数不超过 max_sections、每个章节的概念数不超过 max_concepts，均匀截取
+    """
+    sections = {}
+    for tree in trees:
+        for title, concepts in tree:
+            section = sections.setdefault(dedup_key(title), [title, {}])
+            for name, details in concepts:
+                concept = section[1].setdefault(dedup_key(name), [name, []])
+                concept[1] = dedup(concept[1] + details)
+    return [
+        [title, spread(list(concepts.values()), max_concepts)]
+        for title, concepts in spread(list(sections.values()), max_sections)
+    ]
+
+
+def review_suggestion(engine, item, depth, time_next, current_time):
+    table = engine.nodes[depth]
+    retention = table.retention_of(table.row(item), current_time)
+    return {
+        "item": item,
+        "depth": depth,
+        "retention": retention,
+        "urgency": (current_time - time_next) / 60  # 超时分钟数
+    }
 
 
-def get_article_review_suggestions():
+def get_article_review_suggestions(engine):
     """获取文章复习建议"""
     current_time = time.time()
+
+    # 合并各层到期队列，最早到期（最紧急）的排在最前，只取前10个
+    due = engine.due(range(4), current_time)
+    return [
+        review_suggestion(engine, item, depth, time_next, current_time)
+        for time_next, item, depth in itertools.islice(due, 10)
+    ]
+
+
+def get_library_review_suggestions(library, limit=10):
+    """跨文档复习建议：合并所有文档的到期队列，最早到期的排在最前"""
+    current_time = time.time()
     suggestions = []
-    
-    # 获取需要复习的内容
-    for time_next, (item, depth) in article_retention_queue:
-        if time_next < current_time:
-            retention = article_nodes[depth][item]["retention"]
-            suggestions.append({
-                "item": item,
-                "depth": depth,
-                "retention": retention,
-                "urgency": (current_time - time_next) / 60  # 超时分钟数
-            })
-    
-    # 按紧急程度排序
-    suggestions.sort(key=lambda x: -x["urgency"])
-    return suggestions[:10]  # 返回最紧急的10个
\ No newline at end of file
+    for time_next, document_id, item, depth in library.due(current_time, limit):
+        with library.open(document_id) as engine:
+            suggestion = review_suggestion(engine, item, depth, time_next, current_time)
+        suggestion["document_id"] = document_id
+        suggestions.append(suggestion)
+    return suggestions
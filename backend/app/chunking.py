@@ -0,0 +1,89 @@
+import re
+import time
+import asyncio
+from decomposition_cache import normalize
+
+
+def is_heading(paragraph):
+    """extract_article_content keeps headings as their own short paragraph without final punctuation."""
+    return len(paragraph) <= 80 and not paragraph.rstrip().endswith((".", "。", "!", "?", ":", ";", ","))
+
+
+def chunk_text(content, max_chars=3000):
+    """Split article content into chunks of at most ``max_chars`` on paragraph boundaries.
+
+    Once a chunk is half full, a heading starts the next chunk so sections
+    are not cut in two. A single paragraph longer than ``max_chars`` is cut
+    on sentence boundaries, or hard as a last resort.
+    """
+    paragraphs = []
+    for paragraph in (p.strip() for p in content.split("\n\n")):
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            cut = max(paragraph.rfind(". ", 0, max_chars), paragraph.rfind("。", 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            paragraphs.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            paragraphs.append(paragraph)
+
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in paragraphs:
+        full = size + len(paragraph) + 2 * len(current) > max_chars
+        if current and (full or (is_heading(paragraph) and size >= max_chars // 2)):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+async def map_chunks(chunks, fn, concurrency=4):
+    """Run ``await fn(chunk)`` for every chunk, at most ``concurrency`` at a time.
+
+    Returns the results in chunk order, ``None`` for chunks that failed,
+    and one timing record per chunk.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = [None] * len(chunks)
+
+    async def run(index, chunk):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return await fn(chunk)
+            except Exception as e:
+                print(f"chunk {index} failed:", repr(e))
+                return None
+            finally:
+                timings[index] = {
+                    "index": index,
+                    "chars": len(chunk),
+                    "seconds": round(time.perf_counter() - start, 3),
+                }
+
+    results = await asyncio.gather(*(run(i, chunk) for i, chunk in enumerate(chunks)))
+    for timing, result in zip(timings, results):
+        timing["ok"] = result is not None
+    return results, timings
+
+
+def dedup_key(text):
+    return re.sub(r"[^\w\s]", "", normalize(text)).strip()
+
+
+def dedup(items):
+    """Keep the first of items that only differ in case, spacing or punctuation."""
+    seen = set()
+    result = []
+    for item in items:
+        key = dedup_key(item)
+        if key and key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
@@ -0,0 +1,92 @@
+def count_tokens(message):
+    """Approximate prompt tokens of one chat message: ~4 characters per token plus message framing."""
+    return len(message["content"]) // 4 + 4
+
+
+class ContextWindow:
+    """Token-bounded view of a chat history for the prompt.
+
+    The leading system messages and the most recent turns that fit in
+    ``budget`` tokens are sent verbatim. Older turns are represented by
+    ``summary``, which covers ``history[:summarized]`` and is extended by
+    ``fold`` as turns fall out of the window. A fold goes down to the low
+    water mark of ``budget // 2`` tokens, so once the window is full the
+    summary is extended every few turns instead of on every turn. Each
+    message is counted once, when it is first seen.
+    """
+
+    def __init__(self, budget=3000, summary="", summarized=0):
+        self.budget = budget
+        self.summary = summary
+        self.summarized = summarized
+        self.tokens = []
+        self.begin = summarized
+        self.start = summarized
+        self.fold_to = summarized
+        self.generation = 0
+        self.folding = False  # a fold is queued or running
+
+    def state(self):
+        return {"summary": self.summary, "summarized": self.summarized}
+
+    def reset(self):
+        self.summary = ""
+        self.summarized = 0
+        self.tokens = []
+        self.begin = 0
+        self.start = 0
+        self.fold_to = 0
+        self.generation += 1
+
+    @staticmethod
+    def head(history):
+        """Number of leading system messages."""
+        i = 0
+        while i < len(history) and history[i]["role"] == "system":
+            i += 1
+        return i
+
+    def summary_message(self):
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}
+
+    def messages(self, history, reserve=0):
+        """Messages to send for ``history``, leaving ``reserve`` tokens for the caller's own prompt."""
+        for message in history[len(self.tokens):]:
+            self.tokens.append(count_tokens(message))
+        head = self.head(history)
+        summary = self.summary_message()
+        used = reserve + sum(self.tokens[:head]) + (count_tokens(summary) if summary else 0)
+        self.begin = max(head, self.summarized)
+        self.start = self._window(len(history), used, self.budget)
+        self.fold_to = self._window(len(history), used, self.budget // 2)
+        return history[:head] + ([summary] if summary else []) + history[self.start:]
+
+    def _window(self, end, used, limit):
+        """Start of the most recent turns that fit in ``limit`` tokens after ``used``."""
+        start = end
+        # the latest message is always sent, even if it alone exceeds the budget
+        while start > self.begin and (start == end or used + self.tokens[start - 1] <= limit):
+            start -= 1
+            used += self.tokens[start]
+        return start
+
+    @property
+    def overflow(self):
+        """Whether turns outside the window are not covered by the summary yet."""
+        return self.start > self.begin
+
+    async def fold(self, history, summarize):
+        """Fold the turns before the low water mark into the summary."""
+        # not self.begin: an earlier fold may have moved the summary since messages() ran
+        begin, end = max(self.head(history), self.summarized), self.fold_to
+        if end <= begin:
+            return False
+        generation = self.generation
+        summary = await summarize(self.summary, history[begin:end])
+        if generation != self.generation:
+            return False  # the history was cleared meanwhile
+        self.summary = summary
+        self.summarized = end
+        return True
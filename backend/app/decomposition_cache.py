@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+import metrics
+from storage import data_path
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def prompt_version(*parts):
+    """Fingerprint of everything that shapes a completion: prompt, model, temperature."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+class DecompositionCache:
+    """Content-addressed cache of LLM decomposition results.
+
+    Keys are (split function, prompt version, normalized input). Lookups hit
+    an in-process LRU first and a local SQLite file second; entries older
+    than ``ttl`` seconds or written under another prompt version are never
+    returned and are purged when a split function registers.
+    """
+
+    def __init__(self, path, capacity=4096, ttl=30 * 24 * 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS decompositions ("
+            "key TEXT PRIMARY KEY, function TEXT, version TEXT, value TEXT, created REAL)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def key(function, version, text):
+        return hashlib.sha256(f"{function}\0{version}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, function, version, text):
+        key = self.key(function, version, text)
+        now = time.time()
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.lru.move_to_end(key)
+                metrics.incr("decomposition_cache.hits")
+                return entry[0]
+            row = self.db.execute(
+                "SELECT value, created FROM decompositions WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                metrics.incr("decomposition_cache.misses")
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            metrics.incr("decomposition_cache.hits")
+            metrics.incr("decomposition_cache.disk_hits")
+            return value
+
+    def put(self, function, version, text, value):
+        key = self.key(function, version, text)
+        created = time.time()
+        with self.lock:
+            self._remember(key, value, created)
+            self.db.execute(
+                "INSERT OR REPLACE INTO decompositions VALUES (?, ?, ?, ?, ?)",
+                (key, function, version, json.dumps(value, ensure_ascii=False), created),
+            )
+            self.db.commit()
+
+    def _remember(self, key, value, created):
+        self.lru[key] = (value, created)
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.capacity:
+            self.lru.popitem(last=False)
+
+    def purge(self, function, version):
+        """Drop expired entries of ``function`` and everything cached under an older prompt."""
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM decompositions WHERE function = ? AND (version != ? OR created <= ?)",
+                (function, version, time.time() - self.ttl),
+            )
+            self.db.commit()
+
+    def cached(self, function, *prompt):
+        """Decorate ``async fetch(text) -> list``; calls that raise are not cached."""
+        version = prompt_version(*prompt)
+        self.purge(function, version)
+
+        def decorator(fetch):
+            @functools.wraps(fetch)
+            async def wrapper(text):
+                value = self.get(function, version, text)
+                if value is None:
+                    value = await fetch(text)
+                    self.put(function, version, text, value)
+                return value
+            wrapper.function = function
+            wrapper.version = version
+            return wrapper
+        return decorator
+
+    def cached_many(self, single):
+        """Decorate ``async fetch(texts) -> list`` that answers several inputs in one call.
+
+        Entries are shared with ``single``, a function decorated by ``cached``,
+        and only the inputs it has not cached are passed to ``fetch``. ``fetch``
+        returns ``None`` for inputs it could not answer; they stay ``None`` in
+        the result and are not cached.
+        """
+        def decorator(fetch):
+            @functools.wraps(fetch)
+            async def wrapper(texts):
+                values = [self.get(single.function, single.version, text) for text in texts]
+                missing = [i for i, value in enumerate(values) if value is None]
+                if missing:
+                    for i, value in zip(missing, await fetch([texts[i] for i in missing])):
+                        if value is not None:
+                            self.put(single.function, single.version, texts[i], value)
+                            values[i] = value
+                return values
+            return wrapper
+        return decorator
+
+
+cache = DecompositionCache(
+    data_path("decompositions.sqlite3"),
+    capacity=int(os.getenv("RECAP_DECOMPOSITION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("RECAP_DECOMPOSITION_CACHE_TTL_DAYS", "30")) * 24 * 3600,
+)
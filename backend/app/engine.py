@@ -0,0 +1,247 @@
+import os
+import time
+import math
+import heapq
+import inspect
+from collections import deque
+from node_store import NodeStore
+from scheduler import Scheduler
+from planner import plan_update, count_touched, expand
+from storage import WriteAheadLog, write_snapshot, read_snapshot
+
+
+def update_ease_factor(ef, grade, sensitivity=1.5):
+    delta = sensitivity * (0.3 - (5 - grade) * (0.2 + (5 - grade) * 0.08))
+    ef += delta
+    return max(ef, 1.3)
+
+
+class MemoryEngine:
+    """Node store, due-queues and review history of one layered memory graph.
+
+    ``split_functions[depth](item)`` decomposes a node into its children and
+    may be a coroutine function; ``review`` awaits the decompositions of new
+    nodes first and then applies the event synchronously.
+    With a ``directory`` the engine is durable: every graded update is
+    appended to a write-ahead log together with the decompositions of the
+    nodes it created, the whole state is snapshotted every
+    ``snapshot_every`` events, and construction recovers from the latest
+    snapshot plus the log tail without calling any split function.
+    """
+
+    snapshot_every = 500
+
+    def __init__(self, split_functions, decay_factor, retention_threshold=0.6, history_depth=1,
+                 history_limit=1000, directory=None, expand_concurrency=8):
+        self.split_functions = split_functions
+        self.expand_concurrency = expand_concurrency
+        self.decay_factor = decay_factor
+        self.retention_threshold = retention_threshold
+        self.history_depth = history_depth
+        self.history_limit = history_limit
+        self.directory = directory
+        self.seq = 0
+        self.pending = 0
+        self.wal = None
+        if directory is None:
+            self._clear()
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.history_path = os.path.join(directory, "history.seg")
+        self.snapshot_path = os.path.join(directory, "snapshot.pkl")
+        self.wal_path = os.path.join(directory, "wal.jsonl")
+        self._recover()
+
+    @property
+    def depths(self):
+        return len(self.split_functions)
+
+    def _clear(self):
+        history_path = self.history_path if self.directory else None
+        self.nodes = NodeStore(self.depths, history_path=history_path)
+        self.scheduler = Scheduler(self.depths)
+        self.history = deque(maxlen=self.history_limit)
+
+    def _recover(self):
+        state = read_snapshot(self.snapshot_path)
+        if state is None:
+            self._clear()
+        else:
+            self.seq = state["seq"]
+            self.nodes = NodeStore.from_state(state["nodes"], self.history_path)
+            self.scheduler = Scheduler.from_store(self.nodes)
+            self.history = deque(state["history"], maxlen=self.history_limit)
+        wal = WriteAheadLog(self.wal_path)
+        for record in wal.replay():
+            if record["seq"] > self.seq:
+                self.apply(record)
+                self.pending += 1
+        self.wal = wal
+        # replayed events count towards the next snapshot, or the log would only ever grow
+        if self.pending >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        if self.directory is None:
+            return
+        write_snapshot(self.snapshot_path, {
+            "seq": self.seq,
+            "nodes": self.nodes.state(),
+            "history": list(self.history),
+        })
+        # every event up to self.seq is in the snapshot now
+        self.wal.truncate()
+        self.pending = 0
+
+    def close(self):
+        if self.wal is not None:
+            self.snapshot()
+            self.wal.close()
+        self.nodes.close()
+
+    def reset(self):
+        self.nodes.close()
+        if self.directory is not None:
+            self.wal.truncate()
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+            self.seq = 0
+            self.pending = 0
+        self._clear()
+
+    def new_node(self, item, depth, time_=None, next_=None):
+        time_ = time.time() if time_ is None else time_
+        if next_ is None:
+            next_ = self.split_functions[depth](item)
+            if inspect.isawaitable(next_):
+                next_.close()
+                raise RuntimeError(f"({item!r}, {depth}) must be expanded before it is created")
+        retention = 1
+        ease_factor = 2.5
+        time_last = time_ + math.log(retention) * ease_factor / self.decay_factor
+        review_interval = - math.log(self.retention_threshold) * ease_factor / self.decay_factor
+        time_next = time_last + review_interval
+        table = self.nodes[depth]
+        row = table.add(
+            item,
+            next_,
+            time_last=time_last,
+            time_next=time_next,
+            decay_factor=self.decay_factor,
+            ease_factor=ease_factor,
+            review_interval=review_interval,
+        )
+        table.record(row, time_, time_last, ease_factor)
+        self.scheduler.schedule(depth, row, time_next)
+        return row
+
+    def update_node(self, item, grade, weight, depth, time_=None):
+        table = self.nodes[depth]
+        if item not in table:
+            self.new_node(item, depth)
+        row = table.row(item)
+        time_ = time.time() if time_ is None else time_
+        time_last = float(table.time_last[row] + (time_ - table.time_last[row]))  # * weight
+        table.time_last[row] = time_last
+        ease_factor = update_ease_factor(float(table.ease_factor[row]), grade)
+        table.ease_factor[row] = ease_factor
+        table.record(row, time_, time_last, ease_factor)
+        decay_factor = float(table.decay_factor[row])
+        review_interval = - math.log(self.retention_threshold) * ease_factor / decay_factor
+        time_next = time_last + review_interval
+        table.review_interval[row] = review_interval
+        table.time_next[row] = time_next
+        self.scheduler.schedule(depth, row, time_next)
+
+    async def expand(self, item, depth=0, decompositions=None):
+        """Decompositions of the nodes an update of (item, depth) will create."""
+        return await expand(self.nodes, self.split_functions, item, depth, decompositions, self.expand_concurrency)
+
+    async def review(self, item, grade, depth=0, weight=1, decompositions=None):
+        decompositions = await self.expand(item, depth, decompositions)
+        return self.update(item, grade, depth, weight, decompositions=decompositions)
+
+    def find(self, item):
+        """Shallowest depth that has a node ``item``."""
+        for depth, table in enumerate(self.nodes):
+            if item in table:
+                return depth
+        raise KeyError(item)
+
+    def update(self, item, grade, depth=0, weight=1, time_=None, created=None, decompositions=None, expand=True):
+        """Apply one graded event to (item, depth) and everything below it.
+
+        ``created`` maps (item, depth) to the (time, next) a node was created
+        with; it is only passed when replaying the log. ``decompositions``
+        maps (item, depth) to an already computed next list, used instead of
+        the split function for nodes that have to be created. With
+        ``expand=False`` the event only propagates through existing nodes and
+        a missing (item, depth) raises KeyError before anything changes.
+        """
+        if not expand and item not in self.nodes[depth]:
+            raise KeyError((item, depth))
+        log = []
+
+        def create(item_, depth_):
+            if not expand:
+                raise KeyError((item_, depth_))
+            if created is not None:
+                time_created, decomposition = created[(item_, depth_)]
+            else:
+                time_created = time.time()
+                decomposition = decompositions.get((item_, depth_)) if decompositions else None
+            row = self.new_node(item_, depth_, time_created, decomposition)
+            log.append([item_, depth_, time_created, self.nodes[depth_].next[row]])
+
+        plan = plan_update(self.nodes, create, item, depth, weight)
+        time_ = time.time() if time_ is None else time_
+        if self.wal is not None and created is None:
+            self.seq += 1
+            self.wal.append({
+                "seq": self.seq,
+                "time": time_,
+                "item": item,
+                "grade": grade,
+                "depth": depth,
+                "weight": weight,
+                "created": log,
+            })
+        self.history.extend((time_, x) for x in plan[self.history_depth])
+        for depth_, layer in enumerate(plan):
+            for item_, weight_ in layer.items():
+                self.update_node(item_, grade, weight_, depth_, time_)
+        if self.wal is not None and created is None:
+            self.pending += 1
+            if self.pending >= self.snapshot_every:
+                self.snapshot()
+        return count_touched(plan)
+
+    def apply(self, record):
+        """Replay one logged event."""
+        created = {
+            (item, depth): (time_, [((item_next, depth_next), w) for (item_next, depth_next), w in next_])
+            for item, depth, time_, next_ in record["created"]
+        }
+        self.update(record["item"], record["grade"], record["depth"], record["weight"], record["time"], created)
+        self.seq = record["seq"]
+
+    def retention_at(self, now=None, depth=None):
+        now = time.time() if now is None else now
+        return self.nodes.retention_at(now, depth)
+
+    def due(self, depths, now=None):
+        """Due (time_next, item, depth) across ``depths``, earliest first."""
+        now = time.time() if now is None else now
+        return heapq.merge(*(
+            [(time_next, self.nodes[depth].items[row], depth) for time_next, row in self.scheduler.due(depth, now)]
+            for depth in depths
+        ))
+
+    def next_due(self):
+        return self.scheduler.earliest()
+
+    def node_history(self, item, depth):
+        return self.nodes.full_history(depth, item)
+
+    def to_dict(self, now=None):
+        return self.nodes.to_dict(now)
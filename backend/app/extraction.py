@@ -0,0 +1,195 @@
+import re
+from bs4 import BeautifulSoup
+from lxml import etree
+
+block_tags = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li"}
+container_tags = {"article", "main", "section", "div", "td"}
+skipped_tags = {"script", "style", "nav", "header", "footer", "aside", "form", "noscript"}
+# matched against whole class/id tokens: "entry-content" and "comment-list" count, "has-sidebar" does not
+positive = re.compile(r"(article|content|entry|main|post|story|text|body)([-_]\w+)*", re.I)
+negative = re.compile(
+    r"(comments?|sidebar|related|footer|nav|menu|share|social|promo|ad|advert|banner|widget|cookie|subscribe|breadcrumbs?)"
+    r"([-_](list|area|section|box|wrap|wrapper|container|stories|posts|links|buttons|bar|widget|slot|thread|block))?",
+    re.I,
+)
+
+
+def extract_article_content_soup(html_content, base_url):
+    """提取网页中的文章内容（BeautifulSoup 版本，保留用于对比测试）"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # 移除脚本和样式标签
+    for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
+        script.decompose()
+
+    # 尝试找到主要内容区域
+    content_selectors = [
+        'article', 'main', '.content', '.article', '.post',
+        '.entry-content', '.post-content', '.article-content',
+        '[role="main"]', '.main-content'
+    ]
+
+    main_content = None
+    for selector in content_selectors:
+        main_content = soup.select_one(selector)
+        if main_content:
+            break
+
+    if not main_content:
+        # 如果没找到特定的内容区域，使用body
+        main_content = soup.find('body')
+
+    if not main_content:
+        return {"title": "无法解析", "content": "无法提取网页内容"}
+
+    # 提取标题
+    title = ""
+    title_tag = soup.find('title')
+    if title_tag:
+        title = title_tag.get_text().strip()
+
+    # 如果没有title标签，尝试找h1
+    if not title:
+        h1_tag = main_content.find('h1')
+        if h1_tag:
+            title = h1_tag.get_text().strip()
+
+    # 提取文本内容
+    paragraphs = []
+    for element in main_content.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']):
+        text = element.get_text().strip()
+        if text and len(text) > 10:  # 过滤掉太短的文本
+            paragraphs.append(text)
+
+    content = '\n\n'.join(paragraphs)
+
+    return {
+        "title": title or "未知标题",
+        "content": content or "无法提取有效内容"
+    }
+
+
+def weight(element):
+    """How likely ``element`` is to be the article body, judged by its tag, role, class and id."""
+    if element.tag in ("article", "main") or element.get("role") == "main":
+        return 3
+    if element.tag in ("body", "html"):
+        return 1
+    names = f"{element.get('class', '')} {element.get('id', '')}".split()
+    if any(negative.fullmatch(name) for name in names):
+        return 0
+    if any(positive.fullmatch(name) for name in names):
+        return 2
+    return 1
+
+
+def outside_article(element):
+    """Ancestors of ``element`` up to and including the nearest article-like one, nearest first."""
+    for ancestor in element.iterancestors():
+        yield ancestor
+        if weight(ancestor) == 3:
+            return
+
+
+def choose(scores, depths, total):
+    """The tightest container holding most of the text, preferring article-like ones."""
+    best, best_key = None, None
+    for element, score in scores.items():
+        ratio = score / total
+        w = weight(element)
+        if w >= 2 and ratio >= 0.5:
+            key = (w, depths[element])
+        elif ratio >= 0.8:
+            key = (1, depths[element])
+        else:
+            continue
+        if best_key is None or key > best_key:
+            best, best_key = element, key
+    return best
+
+
+def extract_article_content(html_content, base_url, enough=20000, feed_size=65536):
+    """Title and main text of an HTML page in one pass of lxml's pull parser.
+
+    Every closed p/h/li outside navigation, asides and comment-, share- or
+    ad-like containers (looked for up to the nearest <article>/<main>) is
+    scored into its ancestors. Parsing stops early
+    once an article-like container has closed with ``enough`` characters of
+    text, so comment threads and footers of long pages are never parsed.
+    The winner is the deepest container with most of the text; its blocks
+    are the content, headings as their own paragraphs.
+    """
+    parser = etree.HTMLPullParser(
+        events=("end",), tag=block_tags | container_tags | {"title"},
+        remove_comments=True, remove_pis=True, no_network=True,
+    )
+    title = ""
+    blocks = []        # (text, ancestors, tag) in document order
+    scores = {}        # container -> characters of block text inside it
+    depths = {}
+    has_block = set()  # elements containing a recorded block
+    first_block = {}   # element -> index in blocks of the first block recorded inside it
+
+    def own_text(element):
+        """Text of ``element`` without the blocks nested in it."""
+        parts = [element.text or ""]
+        for child in element:
+            if child.tag not in block_tags and child not in has_block:
+                parts.append("".join(child.itertext()))
+            parts.append(child.tail or "")
+        return " ".join("".join(parts).split())
+
+    def handle(element):
+        """Record one closed element; True once enough of the article has been read."""
+        nonlocal title
+        tag = element.tag
+        if tag == "title":
+            title = title or " ".join("".join(element.itertext()).split())
+            return False
+        if tag in container_tags:
+            return element in scores and scores[element] >= enough and weight(element) >= 2
+        # a page wrapper like <div class="menu-open"> above <main> does not hide the article
+        if any(a.tag in skipped_tags or not weight(a) for a in outside_article(element)):
+            return False
+        nested = element in has_block
+        # an li wrapping a nested list keeps its own text, placed before the nested blocks
+        text = own_text(element) if nested else " ".join("".join(element.itertext()).split())
+        if len(text) <= 10:
+            return False
+        ancestors = list(element.iterancestors())
+        index = first_block[element] if nested else len(blocks)
+        blocks.insert(index, (text, ancestors, tag))
+        for depth, ancestor in enumerate(reversed(ancestors)):
+            has_block.add(ancestor)
+            first_block.setdefault(ancestor, index)
+            scores[ancestor] = scores.get(ancestor, 0) + len(text)
+            depths[ancestor] = depth
+        return False
+
+    done = False
+    for start in range(0, len(html_content), feed_size):
+        parser.feed(html_content[start:start + feed_size])
+        done = any(handle(element) for _, element in parser.read_events())
+        if done:
+            break
+    if not done:
+        # elements closed only implicitly by the end of the input come out of close()
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        for _, element in parser.read_events():
+            handle(element)
+
+    if not blocks:
+        return {"title": title or "未知标题", "content": "无法提取有效内容"}
+
+    winner = choose(scores, depths, sum(len(text) for text, _, _ in blocks))
+    if winner is not None:
+        blocks = [block for block in blocks if winner in block[1]]
+    if not title:
+        title = next((text for text, _, tag in blocks if tag == "h1"), "")
+    return {
+        "title": title or "未知标题",
+        "content": "\n\n".join(text for text, _, _ in blocks),
+    }
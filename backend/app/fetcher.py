@@ -0,0 +1,123 @@
+import re
+import codecs
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import urlparse
+import httpx
+import metrics
+
+browser_headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+
+class NotHtml(Exception):
+    pass
+
+
+class TooLarge(Exception):
+    pass
+
+
+@dataclass
+class Page:
+    url: str
+    status: int
+    headers: httpx.Headers
+    text: str
+
+
+def looks_like_html(head):
+    head = head[:1024].lstrip().lower()
+    return any(marker in head for marker in (b"<!doctype html", b"<html", b"<head", b"<body"))
+
+
+def charset_of(response, head):
+    """Charset from the Content-Type header, else from a <meta> tag, else UTF-8."""
+    charset = None
+    if "charset=" in response.headers.get("content-type", "").lower():
+        charset = response.encoding
+    else:
+        match = re.search(rb"""<meta[^>]+charset=["']?([\w-]+)""", head[:4096], re.I)
+        if match:
+            charset = match.group(1).decode("ascii")
+    try:
+        return codecs.lookup(charset).name if charset else "utf-8"
+    except LookupError:
+        return "utf-8"
+
+
+class Fetcher:
+    """Shared pooled HTTP client for downloading web pages.
+
+    At most ``per_host`` requests run against one host at a time. Bodies are
+    streamed and abandoned as soon as they exceed ``max_bytes`` or turn out
+    not to be HTML, which is decided from the Content-Type header before the
+    download or, without one, from the first bytes. ``deadline`` bounds a
+    whole fetch, including slowly trickling bodies; cancelling the calling
+    task closes the connection.
+    """
+
+    def __init__(self, max_connections=100, per_host=4, max_bytes=5 * 1024 * 1024, timeout=10, deadline=30):
+        self.per_host = per_host
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.hosts = {}
+        self.client = httpx.AsyncClient(
+            headers=browser_headers,
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections // 5),
+        )
+
+    @asynccontextmanager
+    async def _host(self, url):
+        """Hold one of the ``per_host`` slots of the url's host; idle hosts are forgotten."""
+        host = urlparse(url).netloc.lower()
+        entry = self.hosts.get(host)
+        if entry is None:
+            entry = self.hosts[host] = [asyncio.Semaphore(self.per_host), 0]
+        entry[1] += 1  # requests holding or waiting for a slot
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.hosts[host]
+
+    async def fetch(self, url, headers=None):
+        """Download an HTML page. A 304 answer is returned with empty text; other errors raise."""
+        async with self._host(url), asyncio.timeout(self.deadline):
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    return Page(str(response.url), 304, response.headers, "")
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "").lower()
+                if content_type and "html" not in content_type:
+                    metrics.incr("fetch.rejected_type")
+                    raise NotHtml(content_type)
+                if int(response.headers.get("content-length") or 0) > self.max_bytes:
+                    metrics.incr("fetch.rejected_size")
+                    raise TooLarge(response.headers["content-length"])
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    if not body and not content_type and not looks_like_html(chunk):
+                        metrics.incr("fetch.rejected_type")
+                        raise NotHtml("sniffed")
+                    body += chunk
+                    if len(body) > self.max_bytes:
+                        metrics.incr("fetch.rejected_size")
+                        raise TooLarge(len(body))
+                metrics.incr("fetch.pages")
+                metrics.incr("fetch.bytes", len(body))
+                head = bytes(body[:4096])
+                text = bytes(body).decode(charset_of(response, head), errors="replace")
+                return Page(str(response.url), response.status_code, response.headers, text)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,90 @@
+import time
+import asyncio
+from collections import deque
+import metrics
+
+
+class JobQueue:
+    """In-process background jobs run by a fixed pool of asyncio workers.
+
+    Jobs submitted under the same key (a learner id) run one at a time in
+    submission order; jobs of different keys run concurrently. A job that
+    raises is retried up to ``retries`` times with exponential backoff and
+    then dropped and counted as failed.
+    """
+
+    def __init__(self, workers=4, retries=3, backoff=0.5):
+        self.size = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.pending = {}
+        self.ready = None
+        self.workers = []
+        self.depth = 0
+
+    def start(self):
+        self.ready = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._work()) for _ in range(self.size)]
+
+    def submit(self, key, job, *args):
+        """Queue ``await job(*args)`` behind every earlier job of ``key``."""
+        if not self.workers:
+            self.start()
+        queue = self.pending.get(key)
+        if queue is None:
+            queue = self.pending[key] = deque()
+            # a key is handed to a worker only while nothing of it is running
+            self.ready.put_nowait(key)
+        queue.append((time.time(), job, args))
+        self._count(1)
+
+    def _count(self, delta):
+        self.depth += delta
+        metrics.gauge("jobs.depth", self.depth)
+
+    async def _work(self):
+        while True:
+            key = await self.ready.get()
+            queue = self.pending[key]
+            submitted, job, args = queue.popleft()
+            lag = time.time() - submitted
+            metrics.gauge("jobs.lag_seconds", lag)
+            metrics.incr("jobs.lag_seconds_total", lag)
+            await self._run(job, args)
+            self._count(-1)
+            if queue:
+                self.ready.put_nowait(key)
+            else:
+                del self.pending[key]
+            self.ready.task_done()
+
+    async def _run(self, job, args):
+        for attempt in range(self.retries + 1):
+            try:
+                await job(*args)
+                metrics.incr("jobs.completed")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    metrics.incr("jobs.failed")
+                    print("background job failed:", repr(e))
+                    return
+                metrics.incr("jobs.retried")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def join(self):
+        if self.ready is not None:
+            await self.ready.join()
+
+    async def close(self, timeout=10):
+        """Finish queued jobs (up to ``timeout`` seconds), then stop the workers."""
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
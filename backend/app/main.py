@@ -1,16 +1,45 @@
 import memory
 import article_memory
 import agent
+import metrics
+import context
+import chunking
+import os
 import json
 import asyncio
-import requests
-from bs4 import BeautifulSoup
+import httpx
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from urllib.parse import urljoin, urlparse
-from fastapi import FastAPI, WebSocket, HTTPException
+from collections import defaultdict
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from typing import Literal
 from pydantic import BaseModel
-
-app = FastAPI()
+from sessions import SessionManager, Session
+from jobs import JobQueue
+from fetcher import Fetcher, NotHtml, TooLarge
+from page_cache import pages, normalize_url
+from extraction import extract_article_content
+from speculation import Speculator
+from storage import data_path
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.start()
+    yield
+    # 先完成排队中的后台任务，再写入快照，下次启动只需加载快照
+    await jobs.close()
+    speculator.close()
+    sessions.close()
+    await fetcher.close()
+    extract_pool.shutdown(cancel_futures=True)
+    await agent.close()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,26 +48,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-clients = set()
+# 每个学习者的 WebSocket 连接
+clients = defaultdict(set)
+
+# 按学习者ID管理记忆状态和聊天记录，空闲的学习者会被写回磁盘
+sessions = SessionManager(
+    data_path("learners"),
+    max_sessions=int(os.getenv("RECAP_MAX_SESSIONS", "1000")),
+    memory_budget=int(os.getenv("RECAP_SESSION_BUDGET_MB", "512")) * 1024 * 1024,
+    context_budget=int(os.getenv("RECAP_CONTEXT_TOKENS", "3000")),
+    max_documents=int(os.getenv("RECAP_MAX_LOADED_DOCUMENTS", "8")),
+)
+
+# 回复之后的评分和记忆更新在后台执行，同一学习者的任务按顺序执行
+jobs = JobQueue(
+    workers=int(os.getenv("RECAP_JOB_WORKERS", "4")),
+    retries=int(os.getenv("RECAP_JOB_RETRIES", "3")),
+)
+
+# 助手回复一生成就在后台预先分解，学习者回复时只需评分
+speculator = Speculator(ttl=float(os.getenv("RECAP_SPECULATION_TTL", "600")))
+
+# 抓取网页的共享连接池，限制每个网站的并发数和页面大小
+fetcher = Fetcher(
+    per_host=int(os.getenv("RECAP_FETCH_PER_HOST", "4")),
+    max_bytes=int(os.getenv("RECAP_FETCH_MAX_MB", "5")) * 1024 * 1024,
+    timeout=float(os.getenv("RECAP_FETCH_TIMEOUT", "10")),
+)
+
+# 网页解析在独立进程中执行，不占用事件循环
+extract_pool = ProcessPoolExecutor(
+    max_workers=int(os.getenv("RECAP_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    mp_context=multiprocessing.get_context("spawn"),
+)
+
+# 批量导入时所有请求共享的抓取并发数，以及单次请求的网址上限
+bulk_slots = asyncio.Semaphore(int(os.getenv("RECAP_BULK_CONCURRENCY", "16")))
+bulk_max_urls = int(os.getenv("RECAP_BULK_MAX_URLS", "100"))
+
+# 生成摘要时每个分块的字符数
+summary_chunk_chars = int(os.getenv("RECAP_SUMMARY_CHUNK_CHARS", "2000"))
 
 # 存储上传的文档
 uploaded_documents = []
 
 
-def safe_async_call(coro):
+async def current_session(learner_id: str = None, x_learner_id: str = Header(default=None)):
+    """根据查询参数 learner_id 或请求头 X-Learner-Id 获取学习者会话
+
+    依赖项和路由都是 async 的，引擎只在事件循环线程中访问，不会与后台任务并发修改
+    """
+    session = sessions.acquire(learner_id or x_learner_id or "default")
     try:
-        loop = asyncio.get_running_loop()
-        loop.create_task(coro)  # 当前在 async 中
-    except RuntimeError:
-        asyncio.run(coro)  # 当前在 sync 中
+        yield session
+    finally:
+        sessions.release(session)
 
 
 @app.get("/chat/history")
-async def get_chat_history():
+async def get_chat_history(session: Session = Depends(current_session)):
     """获取聊天历史记录"""
     # 过滤掉系统消息和测试消息，只返回用户和助手的对话
     chat_history = [
-        msg for msg in agent.history 
+        msg for msg in session.history 
         if msg["role"] in ["user", "assistant"] 
         and msg["content"] != "连接测试"
         and not msg["content"].startswith("SYSTEM:")
@@ -46,32 +118,39 @@ async def get_chat_history():
     return {"history": chat_history}
 
 @app.post("/chat/clear")
-async def clear_chat_history():
+async def clear_chat_history(session: Session = Depends(current_session)):
     """清除聊天历史记录"""
     # 保留系统消息，清除用户和助手的对话
-    agent.history = [msg for msg in agent.history if msg["role"] == "system"]
+    session.clear_history()
+    session.save_history()
+    speculator.discard(session.learner_id)
     return {"message": "Chat history cleared"}
 
 @app.websocket("/ws/")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, learner_id: str = "default"):
     await websocket.accept()
-    clients.add(websocket)
+    clients[learner_id].add(websocket)
     try:
         while True:
             await websocket.receive_text()
     except:
-        clients.remove(websocket)
+        clients[learner_id].discard(websocket)
+        if not clients[learner_id]:
+            del clients[learner_id]
 
 
-async def send_to_frontend():
+async def send_to_frontend(session):
     try:
-        data = memory.query()
+        # 用 get 读取，没有连接的学习者不会在 clients 中留下空集合
+        if not clients.get(session.learner_id):
+            return
+        data = memory.query(session.memory)
         text = json.dumps(data)
-        for ws in clients.copy():
+        for ws in clients[session.learner_id].copy():
             try:
                 await ws.send_text(text)
             except:
-                clients.remove(ws)
+                clients[session.learner_id].discard(ws)
     except Exception as e:
         print("send_to_frontend error:", e)
 
@@ -82,23 +161,52 @@ class MemoryInput(BaseModel):
 
 
 @app.post("/update/")
-def update_route(data: MemoryInput):
-    memory.update(data.sentence, data.grade)
-    safe_async_call(send_to_frontend())
-    return {"message": "ok"}
+async def update_route(data: MemoryInput, session: Session = Depends(current_session)):
+    touched = await memory.update(session.memory, data.sentence, data.grade)
+    metrics.incr("memory.updates")
+    metrics.incr("memory.nodes_touched", touched)
+    await send_to_frontend(session)
+    return {"message": "ok", "touched": touched}
+
+
+class MemoryBatchInput(BaseModel):
+    updates: list[MemoryInput]
+
+
+@app.post("/update/batch")
+async def update_batch_route(data: MemoryBatchInput, session: Session = Depends(current_session)):
+    """批量更新记忆，所有新句子的分解合并为一次模型调用"""
+    touched = await memory.update_batch(session.memory, [(u.sentence, u.grade) for u in data.updates])
+    metrics.incr("memory.updates", len(data.updates))
+    metrics.incr("memory.nodes_touched", touched)
+    await send_to_frontend(session)
+    return {"message": "ok", "touched": touched}
 
 
 @app.get("/query/")
-def query_route():
-    return memory.query()
+async def query_route(session: Session = Depends(current_session)):
+    return memory.query(session.memory)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """获取后端运行指标"""
+    return metrics.snapshot()
+
+
+@app.get("/query/history")
+async def query_history_route(item: str, depth: int, session: Session = Depends(current_session)):
+    """获取单个节点的完整复习历史（包括已转存到磁盘的旧记录）"""
+    try:
+        return {"item": item, "depth": depth, "history": memory.node_history(session.memory, item, depth)}
+    except (KeyError, IndexError):
+        raise HTTPException(status_code=404, detail="节点不存在")
 
 
 @app.post("/init/")
-def init_route():
-    memory.nodes = [{}, {}, {}, {}]
-    memory.history = []
-    memory.retention_queue = memory.SortedSet()
-    safe_async_call(send_to_frontend())
+async def init_route(session: Session = Depends(current_session)):
+    session.memory.reset()
+    await send_to_frontend(session)
     return {"message": "ok"}
 
 
@@ -113,6 +221,10 @@ class UrlInput(BaseModel):
     name: str
 
 
+class BulkUrlInput(BaseModel):
+    urls: list[str]
+
+
 class SummaryInput(BaseModel):
     content: str
     title: str
@@ -132,149 +244,194 @@ class ArticleKnowledgeGraphInput(BaseModel):
     title: str
     content: str
     document_id: str
+    mode: Literal["layered", "single"] = "layered"  # single: 一次调用抽取整棵知识树
 
 
 class ArticleMemoryUpdateInput(BaseModel):
     item: str
     grade: int
     document_id: str
+    depth: int = None  # 节点所在层（0文章 1章节 2概念 3细节），不传时按条目查找
+
+
+async def turn_decompositions(session, ai_message, user_message, speculated=None):
+    """一轮对话中新句子的分解；助手消息优先使用回复生成后预先算好的结果"""
+    parked = {}
+    if speculated is not None:
+        try:
+            parked = await speculated
+        except Exception:
+            pass  # 预先分解失败时重新分解
+    sentences = [m for m in (ai_message, user_message) if (m, 0) not in parked]
+    return {**parked, **await memory.decompose(session.memory, sentences)}
+
+
+async def grade_turn(learner_id, ai_message, user_message, speculated=None):
+    """后台任务：评分并更新一轮对话涉及的记忆，完成后推送到前端"""
+    session = sessions.acquire(learner_id)
+    try:
+        # 评分和句子分解互不依赖，同时进行
+        res, decompositions = await asyncio.gather(
+            agent.judge(ai_message=ai_message, user_reply=user_message),
+            turn_decompositions(session, ai_message, user_message, speculated),
+        )
+        print(f"AI understanding [评分{res['ai_understanding']}]:", ai_message)
+        print(f"User quality [评分{res['user_quality']}]:", user_message)
+        touched = await memory.update_batch(session.memory, [
+            (ai_message, res["ai_understanding"]),
+            (user_message, res["user_quality"]),
+        ], decompositions)
+        metrics.incr("memory.updates", 2)
+        metrics.incr("memory.nodes_touched", touched)
+        await send_to_frontend(session)
+    finally:
+        sessions.release(session)
 
 
 @app.post("/chat")
-def chat(input: ChatInput):
+async def chat(input: ChatInput, session: Session = Depends(current_session)):
     # 如果是连接测试，直接返回成功响应，不添加到history
     if not input.user_involved and input.message == "连接测试":
         if input.reset_history:
             # 保留系统消息，清除用户和助手的对话
-            agent.history = [msg for msg in agent.history if msg["role"] == "system"]
+            session.clear_history()
+            speculator.discard(session.learner_id)
         return {
             "output": "连接成功",
             "highlight_words": []
         }
     
+    retention_queue = start_turn(input, session)
+    highlighted_words = retention_queue[:]
+
+    try:
+        reply = await agent.reply(prompt_history(session, highlighted_words), highlighted_words)
+    except BaseException:
+        abort_turn(session, input.message, highlighted_words)
+        raise
+    finish_turn(session, reply, highlighted_words)
+
+    return {
+        "output": reply,
+        "highlight_words": retention_queue  # 或者 retention_queue 中的词汇
+    }
+
+
+def start_turn(input, session):
+    """生成回复之前的处理：记录用户消息、提交后台评分，返回本轮的复习队列"""
     # 如果是系统启动对话消息，处理但不添加到history
     if not input.user_involved and input.message.startswith("SYSTEM:"):
         if input.reset_history:
             # 保留系统消息，清除用户和助手的对话
-            agent.history = [msg for msg in agent.history if msg["role"] == "system"]
+            session.clear_history()
         # 对于系统启动消息，不添加到history，直接处理
         pass
     else:
         # 只有真正的用户消息才添加到history
         if input.user_involved:
-            res = agent.judge(
-                ai_message=agent.history[-1]["content"],
-                user_reply=input.message
-            )
-            print(f"AI understanding [评分{res['ai_understanding']}]:", agent.history[-1]["content"])
-            print(f"User quality [评分{res['user_quality']}]:", input.message)
-            memory.update(agent.history[-1]["content"], res["ai_understanding"])
-            memory.update(input.message, res["user_quality"])
-            safe_async_call(send_to_frontend())
-
-        agent.history.append({"role": "user", "content": input.message})
-    retention_queue = memory.query()["retention_queue"]
+            # 评分和记忆更新不影响回复内容，交给后台任务，完成后通过 /ws/ 推送
+            ai_message = session.history[-1]["content"]
+            speculated = speculator.take(session.learner_id, ai_message)
+            jobs.submit(session.learner_id, grade_turn, session.learner_id, ai_message, input.message, speculated)
+
+        session.history.append({"role": "user", "content": input.message})
+
+    # 回复只依赖本轮之前已有的复习队列
+    retention_queue = memory.review_queue(session.memory)
     print("Retention queue:", retention_queue)
+    return retention_queue
 
-    highlighted_words = retention_queue[:]
 
-    if highlighted_words:
-        cue_str = ", ".join(highlighted_words)
-        system_prompt = (
-            "You are an educational assistant helping a student improve their English. "
-            f"The student is currently focusing on these important vocabulary words or morphemes: {cue_str}. "
-            "Make a strong effort to use these words in your responses. "
-            "If the student's message isn't directly related to these words, find a way to connect the conversation to \
-            them through examples, associations, or transitions."
-            "Encourage the student to use them in context."
-            "Do not ask students what topic they want. You decide what to study next."
-        )
-    else:
-        system_prompt = (
-            "You are an educational assistant helping a student improve their English. "
-            "The student hasn’t selected specific vocabulary topics yet. "
-            "Come up with a set of useful and engaging vocabulary themes (e.g., food, hobbies, travel, emotions) "
-            "and guide the conversation naturally to introduce and reinforce those words. "
-            "Encourage the student to use them in context as they respond."
-            "Do not ask students what topic they want. You decide what to study next."
-        )
+def prompt_history(session, highlighted_words):
+    """发送给模型的对话：只保留预算内的最近几轮，更早的对话由摘要代替"""
+    reserve = context.count_tokens({"content": agent.tutor_prompt(highlighted_words)})
+    messages = session.window.messages(session.history, reserve)
+    metrics.gauge("context.prompt_tokens", reserve + sum(context.count_tokens(m) for m in messages))
+    if session.window.overflow and not session.window.folding:
+        # 超出窗口的对话在后台并入摘要，同一时间只排队一次
+        session.window.folding = True
+        jobs.submit(session.learner_id, fold_context, session.learner_id)
+    return messages
 
-    full_messages = [{"role": "system", "content": system_prompt}] + agent.history
 
-    response = agent.client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=full_messages,
-        temperature=0.7
-    )
+async def fold_context(learner_id):
+    """后台任务：把移出上下文窗口的对话并入滚动摘要"""
+    session = sessions.acquire(learner_id)
+    try:
+        if await session.window.fold(session.history, agent.summarize):
+            metrics.incr("context.folds")
+    finally:
+        session.window.folding = False
+        sessions.release(session)
+
 
-    reply = response.choices[0].message.content
-    agent.history.append({"role": "assistant", "content": reply})
+def finish_turn(session, reply, highlighted_words):
+    """记录助手回复，并在后台预先分解回复内容"""
+    session.history.append({"role": "assistant", "content": reply})
+    # 每轮结束即写入聊天记录，进程崩溃时不会丢失驻留会话的对话
+    session.save_history()
+    speculator.start(session.learner_id, reply, memory.decompose(session.memory, [reply]))
 
     used_keywords = [w for w in highlighted_words if w.lower() in reply.lower()]
     print("Used keywords:", used_keywords)
 
-    return {
-        "output": reply,
-        "highlight_words": retention_queue  # 或者 retention_queue 中的词汇
-    }
 
+def abort_turn(session, message, highlighted_words, partial=""):
+    """回复没有完整生成（模型出错或客户端断开）时的处理
 
-def extract_article_content(html_content, base_url):
-    """提取网页中的文章内容"""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # 移除脚本和样式标签
-    for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
-        script.decompose()
-    
-    # 尝试找到主要内容区域
-    content_selectors = [
-        'article', 'main', '.content', '.article', '.post', 
-        '.entry-content', '.post-content', '.article-content',
-        '[role="main"]', '.main-content'
-    ]
-    
-    main_content = None
-    for selector in content_selectors:
-        main_content = soup.select_one(selector)
-        if main_content:
-            break
-    
-    if not main_content:
-        # 如果没找到特定的内容区域，使用body
-        main_content = soup.find('body')
-    
-    if not main_content:
-        return {"title": "无法解析", "content": "无法提取网页内容"}
-    
-    # 提取标题
-    title = ""
-    title_tag = soup.find('title')
-    if title_tag:
-        title = title_tag.get_text().strip()
-    
-    # 如果没有title标签，尝试找h1
-    if not title:
-        h1_tag = main_content.find('h1')
-        if h1_tag:
-            title = h1_tag.get_text().strip()
-    
-    # 提取文本内容
-    paragraphs = []
-    for element in main_content.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']):
-        text = element.get_text().strip()
-        if text and len(text) > 10:  # 过滤掉太短的文本
-            paragraphs.append(text)
-    
-    content = '\n\n'.join(paragraphs)
-    
-    return {
-        "title": title or "未知标题",
-        "content": content or "无法提取有效内容"
-    }
+    已生成部分回复时按回复记录；否则撤回本轮的用户消息，
+    避免历史中出现两条相邻的用户消息，下一轮把学习者自己的话当成助手的话评分
+    """
+    if partial:
+        finish_turn(session, partial, highlighted_words)
+    elif session.history and session.history[-1] == {"role": "user", "content": message}:
+        session.history.pop()
 
 
-def generate_smart_title(title, content, url):
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(input: ChatInput, learner_id: str = None, x_learner_id: str = Header(default=None)):
+    """流式聊天（SSE）：先发送需要高亮的词汇，再逐个发送回复片段，最后发送完整回复和用量统计"""
+    # 会话在整个流式响应期间保持占用，不能交给依赖项（依赖项在响应发送前就会释放）
+    session = sessions.acquire(learner_id or x_learner_id or "default")
+    try:
+        retention_queue = start_turn(input, session)
+    except Exception:
+        sessions.release(session)
+        raise
+
+    async def events():
+        highlighted_words = retention_queue[:]
+        parts = []
+        finished = False
+        try:
+            yield sse("meta", {"highlight_words": retention_queue})
+            usage = None
+            async for chunk in agent.stream_reply(prompt_history(session, highlighted_words), highlighted_words):
+                if chunk.usage is not None:
+                    usage = chunk.usage.model_dump(exclude_none=True)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield sse("token", {"text": chunk.choices[0].delta.content})
+            reply = "".join(parts)
+            finish_turn(session, reply, highlighted_words)
+            finished = True
+            yield sse("done", {"output": reply, "usage": usage})
+        except Exception as e:
+            yield sse("error", {"detail": f"生成回复失败: {str(e)}"})
+        finally:
+            # 出错、超时或客户端断开时，保留部分回复或撤回用户消息
+            if not finished:
+                abort_turn(session, input.message, highlighted_words, "".join(parts))
+            sessions.release(session)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def generate_smart_title(title, content, url):
     """使用LLM生成智能标题或使用网页标题"""
     try:
         # 如果网页标题合理，直接使用
@@ -301,7 +458,7 @@ def generate_smart_title(title, content, url):
         
         user_prompt = f"网址: {url}\n内容预览: {content_preview}"
         
-        response = agent.client.chat.completions.create(
+        response = await agent.client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -325,95 +482,164 @@ def generate_smart_title(title, content, url):
     return f"来自 {domain} 的内容"
 
 
-@app.post("/scrape-url")
-async def scrape_url(input: UrlInput):
-    """爬取网页内容"""
+def scraped_page(url, entry):
+    return {
+        "success": True,
+        "url": url,
+        "name": entry["smart_title"],  # 使用智能生成的标题
+        "title": entry["title"],  # 保留原始标题
+        "content": entry["content"],
+        "word_count": len(entry["content"].split())
+    }
+
+
+async def scrape(url):
+    """抓取并解析一个网页，失败时抛出 HTTPException"""
     try:
         # 验证URL格式
-        parsed_url = urlparse(input.url)
+        parsed_url = urlparse(url)
         if not parsed_url.scheme or not parsed_url.netloc:
             raise HTTPException(status_code=400, detail="无效的URL格式")
         
-        # 设置请求头，模拟浏览器
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        # 发送请求
-        response = requests.get(input.url, headers=headers, timeout=10)
-        response.raise_for_status()
+        # 缓存中仍然新鲜的网页直接返回，不访问网络也不解析
+        entry = pages.get(url)
+        if entry and pages.is_fresh(entry):
+            metrics.incr("page_cache.hits")
+            return scraped_page(url, entry)
         
-        # 检查内容类型
-        content_type = response.headers.get('content-type', '').lower()
-        if 'text/html' not in content_type:
-            raise HTTPException(status_code=400, detail="URL不是HTML页面")
+        # 通过共享连接池异步下载，慢网站不会阻塞其他请求；有缓存时带上条件请求头
+        page = await fetcher.fetch(url, headers=pages.validators(entry))
+        if page.status == 304 and entry:
+            metrics.incr("page_cache.revalidated")
+            return scraped_page(url, pages.refresh(url, entry, page.headers))
         
         # 提取内容
-        article_data = extract_article_content(response.text, input.url)
+        article_data = await asyncio.get_running_loop().run_in_executor(
+            extract_pool, extract_article_content, page.text, url
+        )
         
         # 生成智能标题
-        smart_title = generate_smart_title(
+        smart_title = await generate_smart_title(
             article_data["title"], 
             article_data["content"], 
-            input.url
+            url
         )
         
-        return {
-            "success": True,
-            "url": input.url,
-            "name": smart_title,  # 使用智能生成的标题
-            "title": article_data["title"],  # 保留原始标题
+        pages.put(url, page.headers, article_data["title"], article_data["content"], smart_title)
+        return scraped_page(url, {
+            "title": article_data["title"],
             "content": article_data["content"],
-            "word_count": len(article_data["content"].split())
-        }
+            "smart_title": smart_title,
+        })
         
-    except requests.exceptions.Timeout:
+    except HTTPException:
+        raise
+    except NotHtml:
+        raise HTTPException(status_code=400, detail="URL不是HTML页面")
+    except TooLarge:
+        raise HTTPException(status_code=413, detail="网页内容过大")
+    except (httpx.TimeoutException, TimeoutError):
         raise HTTPException(status_code=408, detail="请求超时，请检查网络连接")
-    except requests.exceptions.ConnectionError:
-        raise HTTPException(status_code=503, detail="无法连接到目标网站")
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=f"HTTP错误: {e.response.status_code}")
+    except httpx.TransportError:
+        raise HTTPException(status_code=503, detail="无法连接到目标网站")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"爬取失败: {str(e)}")
 
 
+@app.post("/scrape-url")
+async def scrape_url(input: UrlInput):
+    """爬取网页内容"""
+    return await scrape(input.url)
+
+
+@app.post("/scrape-urls")
+async def scrape_urls(input: BulkUrlInput):
+    """批量爬取网页，每个网址完成后立即以 NDJSON 返回一行结果"""
+    if len(input.urls) > bulk_max_urls:
+        raise HTTPException(status_code=400, detail=f"一次最多导入{bulk_max_urls}个网址")
+
+    async def limited(url):
+        async with bulk_slots:
+            return await scrape(url)
+
+    async def results():
+        # 同一网址只抓取一次，结果返回给它出现的每个位置
+        tasks = {}
+        indices = defaultdict(list)
+        for index, url in enumerate(input.urls):
+            key = normalize_url(url)
+            if key not in tasks:
+                tasks[key] = asyncio.create_task(limited(url))
+            indices[tasks[key]].append(index)
+        pending = set(tasks.values())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except HTTPException as e:
+                        result = {"success": False, "status": e.status_code, "detail": e.detail}
+                    for index in indices[task]:
+                        line = {**result, "index": index, "url": input.urls[index]}
+                        yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的抓取
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def summarize_text(title, content):
+    """调用模型为一段内容生成摘要"""
+    system_prompt = (
+        "你是一个专业的内容摘要助手。请为提供的文章生成一个简洁、准确的摘要。"
+        "摘要要求：1. 长度控制在100-200字之间 2. 突出文章的核心观点和重要信息 "
+        "3. 使用简洁明了的语言 4. 保持客观中性的语调"
+    )
+
+    user_prompt = f"文章标题：{title}\n\n文章内容：{content}"
+
+    response = await agent.client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=300
+    )
+
+    return response.choices[0].message.content.strip()
+
+
 @app.post("/generate-summary")
 async def generate_summary(input: SummaryInput):
     """生成文章摘要"""
     try:
-        # 限制内容长度，避免token过多
-        content_preview = input.content[:2000] if len(input.content) > 2000 else input.content
-        
-        system_prompt = (
-            "你是一个专业的内容摘要助手。请为提供的文章生成一个简洁、准确的摘要。"
-            "摘要要求：1. 长度控制在100-200字之间 2. 突出文章的核心观点和重要信息 "
-            "3. 使用简洁明了的语言 4. 保持客观中性的语调"
-        )
-        
-        user_prompt = f"文章标题：{input.title}\n\n文章内容：{content_preview}"
-        
-        response = agent.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=300
-        )
-        
-        summary = response.choices[0].message.content.strip()
-        
+        # 长文章分块并行摘要（map），再把各块摘要合并成最终摘要（reduce）
+        chunks = chunking.chunk_text(input.content, summary_chunk_chars)
+        timings = []
+        if len(chunks) <= 1:
+            summary = await summarize_text(input.title, input.content)
+        else:
+            partials, timings = await chunking.map_chunks(
+                chunks, lambda chunk: summarize_text(input.title, chunk), article_memory.chunk_concurrency
+            )
+            partials = [partial for partial in partials if partial]
+            if not partials:
+                raise RuntimeError("所有分块摘要均失败")
+            summary = await summarize_text(input.title, "\n\n".join(partials))
+
         return {
             "success": True,
             "summary": summary,
             "original_length": len(input.content),
-            "summary_length": len(summary)
+            "summary_length": len(summary),
+            "chunks": timings
         }
         
     except Exception as e:
@@ -445,31 +671,37 @@ async def save_document(document: DocumentInput):
 
 
 @app.delete("/documents/{document_id}")
-async def delete_document(document_id: str):
-    """删除文档"""
+async def delete_document(document_id: str, session: Session = Depends(current_session)):
+    """删除文档及其知识图谱"""
     try:
         global uploaded_documents
         uploaded_documents = [doc for doc in uploaded_documents if doc["id"] != document_id]
+        session.articles.remove(document_id)
         return {"success": True, "message": "文档删除成功"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"删除文档失败: {str(e)}")
 
 
 @app.post("/article/create-knowledge-graph")
-async def create_article_knowledge_graph(input: ArticleKnowledgeGraphInput):
+async def create_article_knowledge_graph(input: ArticleKnowledgeGraphInput,
+                                         session: Session = Depends(current_session)):
     """为文章创建知识图谱"""
     try:
-        # 创建文章知识图谱
-        knowledge_graph = article_memory.create_article_knowledge_graph(
-            input.content, 
-            input.title,
-            input.document_id
-        )
+        # 每个文档有独立的知识图谱
+        with session.articles.open(input.document_id) as engine:
+            knowledge_graph, chunks = await article_memory.create_article_knowledge_graph(
+                engine,
+                input.content,
+                input.title,
+                input.document_id,
+                input.mode
+            )
         
         return {
             "success": True,
             "document_id": input.document_id,
             "knowledge_graph": knowledge_graph,
+            "chunks": chunks,  # 每个分块的抽取耗时
             "message": "文章知识图谱创建成功"
         }
     except Exception as e:
@@ -477,11 +709,17 @@ async def create_article_knowledge_graph(input: ArticleKnowledgeGraphInput):
 
 
 @app.get("/article/knowledge-graph/{document_id}")
-async def get_article_knowledge_graph(document_id: str):
+async def get_article_knowledge_graph(document_id: str, session: Session = Depends(current_session)):
     """获取文章知识图谱"""
     try:
-        knowledge_graph = article_memory.query_article_memory()
-        suggestions = article_memory.get_article_review_suggestions()
+        if document_id in session.articles:
+            with session.articles.open(document_id) as engine:
+                knowledge_graph = article_memory.query_article_memory(engine)
+                suggestions = article_memory.get_article_review_suggestions(engine)
+        else:
+            # 还没有创建过图谱的文档不在磁盘上建立空图谱
+            knowledge_graph = {"nodes": [{} for _ in range(4)], "retention_queue": []}
+            suggestions = []
         
         return {
             "success": True,
@@ -494,14 +732,25 @@ async def get_article_knowledge_graph(document_id: str):
 
 
 @app.post("/article/update-memory")
-async def update_article_memory(input: ArticleMemoryUpdateInput):
+async def update_article_memory(input: ArticleMemoryUpdateInput, session: Session = Depends(current_session)):
     """更新文章记忆节点"""
     try:
-        # 更新文章记忆
-        article_memory.update_article_memory(input.item, input.grade)
-        
-        # 获取更新后的状态
-        knowledge_graph = article_memory.query_article_memory()
+        if input.document_id not in session.articles:
+            raise HTTPException(status_code=404, detail="文档还没有知识图谱")
+        if input.depth is not None and not 0 <= input.depth < 4:
+            raise HTTPException(status_code=422, detail="depth 必须在 0-3 之间")
+
+        # 更新文章记忆：只更新图谱中已有的节点，不会触发模型调用
+        with session.articles.open(input.document_id) as engine:
+            try:
+                touched = article_memory.update_article_memory(engine, input.item, input.grade, input.depth)
+            except KeyError:
+                raise HTTPException(status_code=404, detail="节点不存在")
+            metrics.incr("article_memory.updates")
+            metrics.incr("article_memory.nodes_touched", touched)
+
+            # 获取更新后的状态
+            knowledge_graph = article_memory.query_article_memory(engine)
         
         return {
             "success": True,
@@ -509,15 +758,33 @@ async def update_article_memory(input: ArticleMemoryUpdateInput):
             "knowledge_graph": knowledge_graph,
             "message": "记忆更新成功"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新记忆失败: {str(e)}")
 
 
+@app.get("/article/review-suggestions")
+async def get_all_article_review_suggestions(limit: int = 10, session: Session = Depends(current_session)):
+    """获取所有文档中最需要复习的节点"""
+    try:
+        return {
+            "success": True,
+            "suggestions": article_memory.get_library_review_suggestions(session.articles, limit)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取复习建议失败: {str(e)}")
+
+
 @app.get("/article/review-suggestions/{document_id}")
-async def get_article_review_suggestions(document_id: str):
+async def get_article_review_suggestions(document_id: str, session: Session = Depends(current_session)):
     """获取文章复习建议"""
     try:
-        suggestions = article_memory.get_article_review_suggestions()
+        if document_id in session.articles:
+            with session.articles.open(document_id) as engine:
+                suggestions = article_memory.get_article_review_suggestions(engine)
+        else:
+            suggestions = []
         
         return {
             "success": True,
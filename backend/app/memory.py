@@ -1,8 +1,12 @@
+import ast
+import json
 import time
 import math
 import agent
+import metrics
 from collections import defaultdict
-from sortedcontainers import SortedSet
+from engine import MemoryEngine
+from decomposition_cache import cache
 
 
 def merge_pairs(pairs):
@@ -12,31 +16,28 @@ def merge_pairs(pairs):
     return list(counter.items())
 
 
-def split_sentence(sentence):
-    banned_keywords = {
-        'english', 'vocabulary', 'conversation', 'context', 'word', 'words',
-        'sentence', 'question', 'topic', 'topics', 'practice', 'talk', 'language',
-        'learn', 'learning', 'thing', 'something', 'today', 'now', 'time', 'sentence'
-    }
-    sentence = sentence.lower()
-    system_prompt = (
-        "You are a vocabulary knowledge extraction engine. "
-        "Given any English sentence, extract only the specific topic-related content (eg. food topic, sport topic, etc.)\
-         words that a learner should explicitly memorize — such as concrete nouns or useful adjectives in the form of \
-         Python string list."
-        "For each word, return the lemmatized base form."
-        "Exclude all linguistic or instructional terms like: 'practice', 'word', 'words', 'vocabulary', 'English',\
-         'sentence', 'question', 'topic', 'talk', 'language', 'conversation', and so on. "
-        "Also exclude generic actions like: 'do', 'make', 'say', 'help', 'learn' and so on and stop words like 'a', \
-        'the, 'in', 'of', and so on."
-        "Only include words that are related to the current topic in the conversation."
-    )
+sentence_prompt = (
+    "You are a vocabulary knowledge extraction engine. "
+    "Given any English sentence, extract only the specific topic-related content (eg. food topic, sport topic, etc.)\
+     words that a learner should explicitly memorize — such as concrete nouns or useful adjectives in the form of \
+     Python string list."
+    "For each word, return the lemmatized base form."
+    "Exclude all linguistic or instructional terms like: 'practice', 'word', 'words', 'vocabulary', 'English',\
+     'sentence', 'question', 'topic', 'talk', 'language', 'conversation', and so on. "
+    "Also exclude generic actions like: 'do', 'make', 'say', 'help', 'learn' and so on and stop words like 'a', \
+    'the, 'in', 'of', and so on."
+    "Only include words that are related to the current topic in the conversation."
+)
+
+
+@cache.cached("split_sentence", sentence_prompt, "gpt-3.5-turbo", 0)
+async def extract_words(sentence):
     user_message = f"Sentence: \"{sentence}\""
 
-    response = agent.client.chat.completions.create(
+    response = await agent.client.chat.completions.create(
         model="gpt-3.5-turbo",
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": sentence_prompt},
             {"role": "user", "content": user_message}
         ],
         temperature=0
@@ -44,10 +45,80 @@ def split_sentence(sentence):
 
     raw = response.choices[0].message.content.strip()
     try:
-        filtered = eval(raw)
-        return [((w, 1), 1) for w in filtered if isinstance(w, str) and w.lower() not in banned_keywords]
-    except:
+        return [w for w in ast.literal_eval(raw) if isinstance(w, str)]
+    except (ValueError, SyntaxError, TypeError):
+        raise ValueError(f"Unparseable word list: {raw!r}")
+
+
+batch_prompt = (
+    sentence_prompt +
+    " You will be given several numbered sentences as a JSON object. Apply the rules above to each sentence "
+    "separately and return only a JSON object mapping every sentence number to its list of words, "
+    "for example {\"1\": [\"apple\", \"juicy\"], \"2\": []}."
+)
+
+
+@cache.cached_many(extract_words)
+async def extract_words_batch(sentences):
+    user_message = json.dumps({str(i): s for i, s in enumerate(sentences, 1)}, ensure_ascii=False)
+
+    response = await agent.client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": batch_prompt},
+            {"role": "user", "content": user_message}
+        ],
+        temperature=0
+    )
+
+    raw = response.choices[0].message.content.strip()
+    try:
+        keyed = json.loads(raw[raw.index("{"):raw.rindex("}") + 1])
+    except ValueError:
+        keyed = {}
+    if not isinstance(keyed, dict):
+        keyed = {}
+    results = []
+    for i in range(1, len(sentences) + 1):
+        words = keyed.get(str(i))
+        results.append([w for w in words if isinstance(w, str)] if isinstance(words, list) else None)
+    return results
+
+
+banned_keywords = {
+    'english', 'vocabulary', 'conversation', 'context', 'word', 'words',
+    'sentence', 'question', 'topic', 'topics', 'practice', 'talk', 'language',
+    'learn', 'learning', 'thing', 'something', 'today', 'now', 'time', 'sentence'
+}
+
+
+def word_pairs(words):
+    return [((w, 1), 1) for w in words if w.lower() not in banned_keywords]
+
+
+async def split_sentence(sentence):
+    sentence = sentence.lower()
+    try:
+        filtered = await extract_words(sentence)
+    except ValueError:
         return []
+    return word_pairs(filtered)
+
+
+async def split_sentences(sentences):
+    """Decompose several sentences with one model call; same result as split_sentence per item."""
+    if len(sentences) < 2:
+        return [await split_sentence(sentence) for sentence in sentences]
+    lowered = [sentence.lower() for sentence in sentences]
+    results = []
+    for sentence, words in zip(lowered, await extract_words_batch(lowered)):
+        if words is None:
+            # this item was missing or malformed in the batch answer
+            metrics.incr("memory.batch_fallbacks")
+            results.append(await split_sentence(sentence))
+        else:
+            results.append(word_pairs(words))
+    return results
 
 
 def split_word(word):
@@ -90,99 +161,50 @@ def split_letter(letter):
     return []
 
 
-def update_ease_factor(ef, grade, sensitivity=1.5):
-    delta = sensitivity * (0.3 - (5 - grade) * (0.2 + (5 - grade) * 0.08))
-    ef += delta
-    return max(ef, 1.3)
-
-
 retention_threshold = 0.6
 decay_factor = math.log(2) / 30  # half-life time of 30 seconds
-nodes = [{}, {}, {}, {}]
-history = []
-retention_queue = SortedSet()
 split_function = [split_sentence, split_word, split_morpheme, split_letter]
 
 
-def new_node(item, depth):
-    time_ = time.time()
-    retention = 1
-    ease_factor = 2.5
-    time_last = time_ + math.log(retention) * ease_factor / decay_factor
-    review_interval = - math.log(retention_threshold) * ease_factor / decay_factor
-    time_next = time_last + review_interval
-    retention_queue.add((time_next, (item, depth)))
-    return {
-        "retention": retention,
-        "time": time_,
-        "time_last": time_last,
-        "time_next": time_next,
-        "decay_factor": decay_factor,
-        "ease_factor": ease_factor,
-        "review_interval": review_interval,
-        "next": split_function[depth](item),
-        "history": {
-            time_: {
-                "time_last": time_last,
-                "ease_factor": ease_factor,
-            }
-        },
-    }
+def new_engine(directory=None):
+    return MemoryEngine(split_function, decay_factor, retention_threshold, history_depth=1, directory=directory)
 
 
-def update_retention(item, depth):
-    nodes[depth][item]["time"] = time.time()
-    time_ = nodes[depth][item]["time"]
-    time_last = nodes[depth][item]["time_last"]
-    decay_factor = nodes[depth][item]["decay_factor"]
-    ease_factor = nodes[depth][item]["ease_factor"]
-    nodes[depth][item]["retention"] = math.exp(-decay_factor / ease_factor * (time_ - time_last))
-
-
-def update_node(item, grade, weight, depth):
-    if item not in nodes[depth]:
-        nodes[depth][item] = new_node(item, depth)
-    time_ = time.time()
-    time_last = nodes[depth][item]["time_last"] + (time_ - nodes[depth][item]["time_last"])  # * weight
-    nodes[depth][item]["time_last"] = time_last
-    ease_factor = update_ease_factor(nodes[depth][item]["ease_factor"], grade)
-    nodes[depth][item]["ease_factor"] = ease_factor
-    nodes[depth][item]["history"][time_] = {
-        "time_last": time_last,
-        "ease_factor": ease_factor,
-    }
-    decay_factor = nodes[depth][item]["decay_factor"]
-    time_next = nodes[depth][item]["time_next"]
-    retention_queue.discard((time_next, (item, depth)))
-    review_interval = - math.log(retention_threshold) * ease_factor / decay_factor
-    time_next = time_last + review_interval
-    nodes[depth][item]["review_interval"] = review_interval
-    nodes[depth][item]["time_next"] = time_next
-    retention_queue.add((time_next, (item, depth)))
-    update_retention(item, depth)
-
-
-def update(item, grade, depth=0, weight=1):
-    if depth == 1:
-        history.append((time.time(), item))
-    update_node(item, grade, weight, depth)
-    for (item_next, depth_next), w in nodes[depth][item]["next"]:
-        update(item_next, grade, depth_next, weight * w)
-
-
-def update_all():
-    for depth in range(4):
-        for item in nodes[depth].keys():
-            update_retention(item, depth)
-
-
-def query():
-    queue = [x[1][0] for x in retention_queue if
-             x[0] < time.time()
-             and x[1][1] in {1}
-             and len(x[1][0]) > 2
-             ]
+async def update(engine, item, grade, depth=0, weight=1):
+    return await engine.review(item, grade, depth, weight)
+
+
+async def decompose(engine, sentences):
+    """Decompositions of the sentences not in the graph yet, from one model call; grade-independent."""
+    new = list(dict.fromkeys(sentence for sentence in sentences if sentence not in engine.nodes[0]))
+    return {(sentence, 0): next_ for sentence, next_ in zip(new, await split_sentences(new))}
+
+
+async def update_batch(engine, events, decompositions=None):
+    """Apply (sentence, grade) events in order, decomposing all new sentences in one model call."""
+    if decompositions is None:
+        decompositions = await decompose(engine, [sentence for sentence, _ in events])
+    touched = 0
+    for sentence, grade in events:
+        touched += await engine.review(sentence, grade, decompositions=decompositions)
+    return touched
+
+
+def update_all(engine, depth=None):
+    return engine.retention_at(time.time(), depth)
+
+
+def node_history(engine, item, depth):
+    return engine.node_history(item, depth)
+
+
+def review_queue(engine, now=None):
+    return [item for _, item, _ in engine.due([1], now) if len(item) > 2]
+
+
+def query(engine):
+    now = time.time()
     return {
-        "nodes": nodes,
-        "retention_queue": queue
+        "nodes": engine.to_dict(now),
+        "retention_queue": review_queue(engine, now)
     }
@@ -0,0 +1,19 @@
+from collections import defaultdict
+
+counters = defaultdict(float)
+gauges = {}
+
+
+def incr(name, value=1):
+    counters[name] += value
+
+
+def gauge(name, value):
+    gauges[name] = value
+
+
+def snapshot():
+    return {
+        "counters": dict(counters),
+        "gauges": dict(gauges),
+    }
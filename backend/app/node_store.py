@@ -0,0 +1,296 @@
+import sys
+import math
+import time
+import functools
+import numpy as np
+from storage import HistorySegment
+
+
+class EdgeList:
+    """Per-row decomposition edges ``[((item, depth), weight), ...]``.
+
+    Rows restored from a snapshot stay packed in flat arrays and are only
+    turned back into tuples the first time they are read, which keeps
+    recovery independent of the number of edges.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.packed = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, row):
+        edges = self.rows[row]
+        if edges is None:
+            items, depths, weights, offsets = self.packed
+            start, end = offsets[row], offsets[row + 1]
+            edges = list(zip(zip(items[start:end], depths[start:end].tolist()), weights[start:end].tolist()))
+            self.rows[row] = edges
+        return edges
+
+    def append(self, edges):
+        self.rows.append(edges)
+
+    def pack(self):
+        items, depths, weights, offsets = [], [], [], [0]
+        row, size = 0, len(self.rows)
+        while row < size:
+            edges = self.rows[row]
+            if edges is not None:
+                for (item, depth), weight in edges:
+                    items.append(item)
+                    depths.append(depth)
+                    weights.append(weight)
+                offsets.append(len(items))
+                row += 1
+                continue
+            # copy a run of still-packed rows as whole slices
+            start = row
+            while row < size and self.rows[row] is None:
+                row += 1
+            packed_items, packed_depths, packed_weights, packed_offsets = self.packed
+            begin, end = packed_offsets[start], packed_offsets[row]
+            shift = len(items) - begin
+            items.extend(packed_items[begin:end])
+            depths.extend(packed_depths[begin:end].tolist())
+            weights.extend(packed_weights[begin:end].tolist())
+            offsets.extend((packed_offsets[start + 1:row + 1] + shift).tolist())
+        return items, np.array(depths, dtype=np.uint8), np.array(weights), np.array(offsets, dtype=np.int64)
+
+    @classmethod
+    def unpack(cls, packed):
+        edges = cls()
+        edges.packed = packed
+        edges.rows = [None] * (len(packed[3]) - 1)
+        return edges
+
+
+class NodeTable:
+    """Columnar storage for all nodes of a single depth.
+
+    Items are interned to dense row ids. Per-node scalars live in NumPy
+    columns indexed by row, decomposition edges stay in a per-row list.
+    Retention is never stored, it is derived from time_last, decay_factor
+    and ease_factor whenever it is read.
+
+    Review history is a fixed-capacity ring of packed (time, time_last,
+    ease_factor) records per row; records pushed out of the ring are handed
+    to ``spill`` so they can be kept in cold storage.
+    """
+
+    columns = ("time_last", "time_next", "decay_factor", "ease_factor", "review_interval")
+    history_fields = ("time", "time_last", "ease_factor")
+
+    def __init__(self, capacity=64, history_capacity=8, spill=None):
+        self.index = {}
+        self.items = []
+        self.next = EdgeList()
+        self.spill = spill
+        for name in self.columns:
+            setattr(self, name, np.zeros(capacity))
+        self.history = np.zeros((capacity, history_capacity, len(self.history_fields)))
+        self.history_count = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def capacity(self):
+        return len(self.time_last)
+
+    def _grow(self):
+        size = len(self.items)
+        capacity = 2 * self.capacity
+        for name in self.columns:
+            column = np.zeros(capacity)
+            column[:size] = getattr(self, name)[:size]
+            setattr(self, name, column)
+        history = np.zeros((capacity,) + self.history.shape[1:])
+        history[:size] = self.history[:size]
+        self.history = history
+        history_count = np.zeros(capacity, dtype=np.int64)
+        history_count[:size] = self.history_count[:size]
+        self.history_count = history_count
+
+    def add(self, item, next_, **values):
+        if len(self.items) == self.capacity:
+            self._grow()
+        item = sys.intern(item)
+        row = len(self.items)
+        self.index[item] = row
+        self.items.append(item)
+        self.next.append(next_)
+        for name, value in values.items():
+            getattr(self, name)[row] = value
+        return row
+
+    def row(self, item):
+        return self.index[item]
+
+    def record(self, row, time_, time_last, ease_factor):
+        capacity = self.history.shape[1]
+        count = int(self.history_count[row])
+        slot = count % capacity
+        if count >= capacity and self.spill is not None:
+            self.spill(row, *self.history[row, slot].tolist())
+        self.history[row, slot] = (time_, time_last, ease_factor)
+        self.history_count[row] = count + 1
+
+    def recent_history(self, row):
+        """Records still held in the ring, oldest first."""
+        capacity = self.history.shape[1]
+        count = int(self.history_count[row])
+        if count <= capacity:
+            return self.history[row, :count]
+        return np.roll(self.history[row], -(count % capacity), axis=0)
+
+    def history_dict(self, row):
+        return {
+            time_: {"time_last": time_last, "ease_factor": ease_factor}
+            for time_, time_last, ease_factor in self.recent_history(row).tolist()
+        }
+
+    def retention_of(self, row, now=None):
+        now = time.time() if now is None else now
+        return math.exp(-self.decay_factor[row] / self.ease_factor[row] * (now - self.time_last[row]))
+
+    def retention_at(self, now):
+        """Compute retention for every row at a single timestamp in one vectorized pass."""
+        size = len(self.items)
+        retention = np.divide(self.decay_factor[:size], self.ease_factor[:size])
+        retention *= self.time_last[:size] - now
+        return np.exp(retention, out=retention)
+
+    def get(self, item, now=None):
+        now = time.time() if now is None else now
+        row = self.index[item]
+        node = {name: float(getattr(self, name)[row]) for name in self.columns}
+        node["retention"] = self.retention_of(row, now)
+        node["time"] = now
+        node["next"] = self.next[row]
+        node["history"] = self.history_dict(row)
+        return node
+
+    def to_dict(self, now=None):
+        now = time.time() if now is None else now
+        size = len(self.items)
+        columns = [getattr(self, name)[:size].tolist() for name in self.columns]
+        retention = self.retention_at(now)[:size].tolist()
+        result = {}
+        for row, item in enumerate(self.items[:size]):
+            node = {name: column[row] for name, column in zip(self.columns, columns)}
+            node["retention"] = retention[row]
+            node["time"] = now
+            node["next"] = self.next[row]
+            node["history"] = self.history_dict(row)
+            result[item] = node
+        return result
+
+    def state(self):
+        size = len(self.items)
+        state = {name: getattr(self, name)[:size].copy() for name in self.columns}
+        state["items"] = self.items
+        state["next"] = self.next.pack()
+        state["history"] = self.history[:size].copy()
+        state["history_count"] = self.history_count[:size].copy()
+        return state
+
+    @classmethod
+    def from_state(cls, state, spill=None):
+        size = len(state["items"])
+        table = cls(max(64, 1 << size.bit_length()), state["history"].shape[1], spill)
+        table.items = [sys.intern(item) for item in state["items"]]
+        table.index = {item: row for row, item in enumerate(table.items)}
+        table.next = EdgeList.unpack(state["next"])
+        for name in cls.columns:
+            getattr(table, name)[:size] = state[name]
+        table.history[:size] = state["history"]
+        table.history_count[:size] = state["history_count"]
+        return table
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.columns) + self.history.nbytes + self.history_count.nbytes
+
+
+class NodeStore:
+    """One NodeTable per depth of the sentence -> word -> morpheme -> letter graph.
+
+    With a ``history_path``, review records that fall out of the per-node
+    rings are appended to a HistorySegment and can be read back through
+    ``full_history``.
+    """
+
+    def __init__(self, depths=4, history_path=None, history_capacity=8, history_offset=0):
+        self.segment = HistorySegment(history_path, history_offset) if history_path else None
+        self.tables = [
+            NodeTable(history_capacity=history_capacity, spill=self._spill(depth))
+            for depth in range(depths)
+        ]
+
+    def state(self):
+        return {
+            "tables": [table.state() for table in self.tables],
+            "history_offset": self.segment.offset if self.segment is not None else 0,
+        }
+
+    @classmethod
+    def from_state(cls, state, history_path=None):
+        store = cls(0, history_path, history_offset=state["history_offset"])
+        store.tables = [
+            NodeTable.from_state(table, store._spill(depth))
+            for depth, table in enumerate(state["tables"])
+        ]
+        return store
+
+    def _spill(self, depth):
+        if self.segment is None:
+            return None
+        return functools.partial(self.segment.append, depth)
+
+    def __getitem__(self, depth):
+        return self.tables[depth]
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def retention_at(self, now, depth=None):
+        if depth is not None:
+            return self.tables[depth].retention_at(now)
+        return [table.retention_at(now) for table in self.tables]
+
+    def to_dict(self, now=None):
+        now = time.time() if now is None else now
+        return [table.to_dict(now) for table in self.tables]
+
+    def full_history(self, depth, item):
+        table = self.tables[depth]
+        row = table.row(item)
+        history = {}
+        if self.segment is not None:
+            for record in self.segment.read(depth, row):
+                history[float(record["time"])] = {
+                    "time_last": float(record["time_last"]),
+                    "ease_factor": float(record["ease_factor"]),
+                }
+        history.update(table.history_dict(row))
+        return history
+
+    def close(self):
+        if self.segment is not None:
+            self.segment.close()
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables)
@@ -0,0 +1,147 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import metrics
+from storage import data_path
+
+tracking_params = re.compile(r"^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|spm|ref)$", re.I)
+
+
+def normalize_url(url):
+    """Cache key of ``url``: lowercase scheme and host, no default port, fragment or tracking parameters."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not tracking_params.match(k))
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def freshness(headers, default):
+    """Seconds a response stays fresh: Cache-Control max-age capped at ``default``, None for no-store."""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return min(int(match.group(1)), default) if match else default
+
+
+class PageCache:
+    """Scraped pages by normalized URL, with the validators to revalidate them.
+
+    An entry holds the extracted title and content, the smart title and the
+    ETag / Last-Modified of the response. Until ``expires`` it is served as
+    is; after that the caller revalidates it with a conditional GET and
+    either ``refresh``es it on 304 or ``put``s the new page. Entries not
+    loaded, stored or refreshed for ``ttl`` seconds are dropped at startup.
+    """
+
+    fields = ("url", "title", "content", "smart_title", "etag", "last_modified", "expires")
+
+    def __init__(self, path, capacity=256, fresh_for=3600, ttl=30 * 24 * 3600):
+        self.capacity = capacity
+        self.fresh_for = fresh_for
+        self.ttl = ttl
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT PRIMARY KEY, url TEXT, title TEXT, content TEXT, smart_title TEXT, "
+            "etag TEXT, last_modified TEXT, expires REAL, used REAL)"
+        )
+        self.db.execute("DELETE FROM pages WHERE used <= ?", (time.time() - self.ttl,))
+        self.db.commit()
+
+    def get(self, url):
+        key = normalize_url(url)
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is None:
+                row = self.db.execute(
+                    f"SELECT {', '.join(self.fields)} FROM pages WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    metrics.incr("page_cache.misses")
+                    return None
+                entry = dict(zip(self.fields, row))
+                self._remember(key, entry)
+                self.db.execute("UPDATE pages SET used = ? WHERE key = ?", (time.time(), key))
+                self.db.commit()
+            else:
+                self.lru.move_to_end(key)
+            return dict(entry)
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry["expires"] > time.time()
+
+    @staticmethod
+    def validators(entry):
+        """Conditional request headers for revalidating ``entry``."""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, headers, title, content, smart_title):
+        """Store a freshly downloaded page; responses marked no-store are skipped."""
+        fresh_for = freshness(headers, self.fresh_for)
+        if fresh_for is None:
+            return
+        key = normalize_url(url)
+        entry = {
+            "url": url,
+            "title": title,
+            "content": content,
+            "smart_title": smart_title,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "expires": time.time() + fresh_for,
+        }
+        with self.lock:
+            self._remember(key, entry)
+            self.db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, *(entry[field] for field in self.fields), time.time()),
+            )
+            self.db.commit()
+
+    def refresh(self, url, entry, headers):
+        """``entry`` was not modified: extend its freshness and take over new validators."""
+        key = normalize_url(url)
+        entry = dict(entry)
+        entry["expires"] = time.time() + (freshness(headers, self.fresh_for) or 0)
+        entry["etag"] = headers.get("etag") or entry["etag"]
+        entry["last_modified"] = headers.get("last-modified") or entry["last_modified"]
+        with self.lock:
+            self._remember(key, entry)
+            self.db.execute(
+                "UPDATE pages SET etag = ?, last_modified = ?, expires = ?, used = ? WHERE key = ?",
+                (entry["etag"], entry["last_modified"], entry["expires"], time.time(), key),
+            )
+            self.db.commit()
+        return entry
+
+    def _remember(self, key, entry):
+        self.lru[key] = entry
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.capacity:
+            self.lru.popitem(last=False)
+
+
+pages = PageCache(
+    data_path("pages.sqlite3"),
+    capacity=int(os.getenv("RECAP_PAGE_CACHE_SIZE", "256")),
+    fresh_for=float(os.getenv("RECAP_PAGE_CACHE_FRESH_SECONDS", "3600")),
+    ttl=float(os.getenv("RECAP_PAGE_CACHE_TTL_DAYS", "30")) * 24 * 3600,
+)
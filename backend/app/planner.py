@@ -0,0 +1,72 @@
+import asyncio
+import inspect
+from collections import defaultdict
+import metrics
+
+
+def plan_update(nodes, create, item, depth, weight=1):
+    """Walk the decomposition DAG below (item, depth) exactly once.
+
+    Edges only ever point to a deeper layer, so the graph is visited layer by
+    layer: every node of a layer has received all of its incoming weight
+    before its own children are expanded. ``create(item, depth)`` is called
+    for nodes that do not exist yet.
+
+    Returns one ``{item: combined_weight}`` dict per depth.
+    """
+    plan = [defaultdict(float) for _ in range(len(nodes))]
+    plan[depth][item] += weight
+    for current in range(depth, len(nodes)):
+        table = nodes[current]
+        for target, target_weight in plan[current].items():
+            if target not in table:
+                create(target, current)
+            for (item_next, depth_next), w in table.next[table.row(target)]:
+                plan[depth_next][item_next] += target_weight * w
+    return plan
+
+
+def count_touched(plan):
+    return sum(len(layer) for layer in plan)
+
+
+async def expand(nodes, split_functions, item, depth, known=None, concurrency=8):
+    """Decompose every node below (item, depth) that ``nodes`` does not have yet.
+
+    Existing nodes were created together with their whole subtree, so only
+    missing nodes are descended into. The missing nodes of one layer are
+    decomposed concurrently, at most ``concurrency`` at a time; split
+    functions may be coroutines. If a split function raises, the rest of
+    its layer still finishes (so cached splitters keep their results) and
+    the first exception is re-raised: a node is never created without its
+    decomposition. Split functions that can degrade, like the article
+    splitters, fall back themselves instead of raising.
+
+    Returns ``known`` extended with ``{(item, depth): next}`` for each node
+    plan_update is going to create.
+    """
+    decompositions = dict(known or ())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def split(target, current):
+        async with semaphore:
+            next_ = split_functions[current](target)
+            if inspect.isawaitable(next_):
+                next_ = await next_
+            return next_
+
+    pending = [set() for _ in range(len(nodes))]
+    pending[depth].add(item)
+    for current in range(depth, len(nodes)):
+        missing = [target for target in pending[current] if target not in nodes[current]]
+        unknown = [target for target in missing if (target, current) not in decompositions]
+        results = await asyncio.gather(*(split(target, current) for target in unknown), return_exceptions=True)
+        failures = [next_ for next_ in results if isinstance(next_, BaseException)]
+        if failures:
+            metrics.incr("planner.split_failures", len(failures))
+            raise failures[0]
+        decompositions.update(((target, current), next_) for target, next_ in zip(unknown, results))
+        for target in missing:
+            for (item_next, depth_next), _ in decompositions[(target, current)]:
+                pending[depth_next].add(item_next)
+    return decompositions
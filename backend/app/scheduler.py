@@ -0,0 +1,138 @@
+class DueQueue:
+    """Indexed binary min-heap of node rows keyed by their time_next.
+
+    Every row appears at most once; ``schedule`` moves an existing entry in
+    O(log n) instead of the discard + add a sorted set of tuples needs.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.keys = {}
+        self.position = {}
+
+    @classmethod
+    def from_keys(cls, keys):
+        """Build a queue over rows 0..n-1 from an array of their time_next values."""
+        queue = cls()
+        # a sorted array already satisfies the heap property
+        queue.heap = keys.argsort(kind="stable").tolist()
+        queue.keys = dict(enumerate(keys.tolist()))
+        queue.position = {row: i for i, row in enumerate(queue.heap)}
+        return queue
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, row):
+        return row in self.position
+
+    def __iter__(self):
+        return iter(self.heap)
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i]] = i
+        self.position[heap[j]] = j
+
+    def _sift_up(self, i):
+        heap, keys = self.heap, self.keys
+        while i > 0:
+            parent = (i - 1) >> 1
+            if keys[heap[i]] >= keys[heap[parent]]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        heap, keys = self.heap, self.keys
+        size = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and keys[heap[child]] < keys[heap[smallest]]:
+                    smallest = child
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+    def schedule(self, row, time_next):
+        if row not in self.position:
+            self.keys[row] = time_next
+            self.position[row] = len(self.heap)
+            self.heap.append(row)
+            self._sift_up(len(self.heap) - 1)
+            return
+        previous = self.keys[row]
+        self.keys[row] = time_next
+        if time_next < previous:
+            self._sift_up(self.position[row])
+        else:
+            self._sift_down(self.position[row])
+
+    def remove(self, row):
+        i = self.position.pop(row)
+        del self.keys[row]
+        last = self.heap.pop()
+        if i < len(self.heap):
+            self.heap[i] = last
+            self.position[last] = i
+            self._sift_up(i)
+            self._sift_down(self.position[last])
+
+    def peek(self):
+        row = self.heap[0]
+        return self.keys[row], row
+
+    def due(self, before):
+        """Return ``(time_next, row)`` pairs with time_next < before, earliest first.
+
+        Walks the heap from the root and stops descending at the first entry
+        on each branch that is not due yet, so the cost depends on the number
+        of due entries rather than on the queue size.
+        """
+        heap, keys = self.heap, self.keys
+        size = len(heap)
+        result = []
+        stack = [0] if size else []
+        while stack:
+            i = stack.pop()
+            key = keys[heap[i]]
+            if key >= before:
+                continue
+            result.append((key, heap[i]))
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size:
+                    stack.append(child)
+        result.sort()
+        return result
+
+
+class Scheduler:
+    """One DueQueue per depth, addressed by (depth, row)."""
+
+    def __init__(self, depths=4):
+        self.queues = [DueQueue() for _ in range(depths)]
+
+    @classmethod
+    def from_store(cls, nodes):
+        scheduler = cls(0)
+        scheduler.queues = [DueQueue.from_keys(table.time_next[:len(table)]) for table in nodes]
+        return scheduler
+
+    def __getitem__(self, depth):
+        return self.queues[depth]
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def schedule(self, depth, row, time_next):
+        self.queues[depth].schedule(row, time_next)
+
+    def due(self, depth, before):
+        return self.queues[depth].due(before)
+
+    def earliest(self):
+        """Smallest time_next over all depths, or None if nothing is scheduled."""
+        return min((queue.peek()[0] for queue in self.queues if queue), default=None)
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+import agent
+import memory
+import metrics
+from context import ContextWindow
+from article_library import ArticleLibrary
+from storage import safe_id
+
+node_overhead = 256  # rough per-node cost of the Python-side item, index and edge objects
+
+
+class Session:
+    """All state of one learner: vocabulary memory, article memory and chat history.
+
+    ``history`` is the full transcript; ``window`` is the part of it that is
+    sent to the model, with older turns folded into a summary.
+    """
+
+    def __init__(self, learner_id, directory, context_budget=3000, max_documents=8):
+        self.learner_id = learner_id
+        self.directory = directory
+        self.chat_path = os.path.join(directory, "chat.json")
+        self.context_path = os.path.join(directory, "context.json")
+        self.memory = memory.new_engine(os.path.join(directory, "memory"))
+        self.articles = ArticleLibrary(os.path.join(directory, "articles"), max_documents)
+        self.history = self._load_history()
+        self.window = ContextWindow(context_budget, **self._load_json(self.context_path, {}))
+        self.active = 0
+        self.last_used = time.time()
+
+    def _load_history(self):
+        return self._load_json(self.chat_path, None) or agent.new_history()
+
+    @staticmethod
+    def _load_json(path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_json(path, value):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def save_history(self):
+        self._save_json(self.chat_path, self.history)
+        self._save_json(self.context_path, self.window.state())
+
+    def clear_history(self):
+        """Drop the conversation but keep the system messages."""
+        self.history = [msg for msg in self.history if msg["role"] == "system"]
+        self.window.reset()
+
+    @property
+    def nbytes(self):
+        nodes = sum(len(table) for table in self.memory.nodes) + self.articles.node_count
+        chat = sum(len(message["content"]) for message in self.history)
+        return self.memory.nodes.nbytes + self.articles.nbytes + node_overhead * nodes + chat
+
+    def close(self):
+        self.save_history()
+        self.memory.close()
+        self.articles.close()
+
+
+class SessionManager:
+    """Learner id -> Session, bounded by an LRU policy and a memory budget.
+
+    Idle sessions beyond ``max_sessions`` or ``memory_budget`` bytes are
+    snapshotted to disk and dropped; the next request for that learner loads
+    them back. Sessions in use by a request are never evicted. Each
+    session's size is measured when it is loaded and when a request releases
+    it, and ``total`` keeps the running sum, so a request never walks the
+    other sessions.
+    """
+
+    def __init__(self, directory, max_sessions=1000, memory_budget=512 * 1024 * 1024, context_budget=3000,
+                 max_documents=8):
+        self.directory = directory
+        self.max_sessions = max_sessions
+        self.memory_budget = memory_budget
+        self.context_budget = context_budget
+        self.max_documents = max_documents
+        self.sessions = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def acquire(self, learner_id):
+        with self.lock:
+            session = self.sessions.get(learner_id)
+            if session is None:
+                session = Session(learner_id, os.path.join(self.directory, safe_id(learner_id)),
+                                  self.context_budget, self.max_documents)
+                self.sessions[learner_id] = session
+                self._measure(session)
+                metrics.incr("sessions.loaded")
+            else:
+                self.sessions.move_to_end(learner_id)
+            session.active += 1
+            session.last_used = time.time()
+            self._evict()
+            return session
+
+    def release(self, session):
+        with self.lock:
+            session.active -= 1
+            if self.sessions.get(session.learner_id) is session:
+                self._measure(session)
+
+    def _measure(self, session):
+        size = session.nbytes
+        self.total += size - self.sizes.get(session.learner_id, 0)
+        self.sizes[session.learner_id] = size
+
+    def _over(self):
+        return len(self.sessions) > self.max_sessions or self.total > self.memory_budget
+
+    def _evict(self):
+        for learner_id in list(self.sessions) if self._over() else ():
+            if not self._over():
+                break
+            session = self.sessions[learner_id]
+            if session.active:
+                continue
+            self.total -= self.sizes.pop(learner_id)
+            session.close()
+            del self.sessions[learner_id]
+            metrics.incr("sessions.evicted")
+        metrics.gauge("sessions.resident", len(self.sessions))
+        metrics.gauge("sessions.bytes", self.total)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            self.sizes.clear()
+            self.total = 0
@@ -0,0 +1,57 @@
+import time
+import asyncio
+import metrics
+
+
+class Speculator:
+    """Short-lived results of work started before anyone asked for it.
+
+    ``start(key, text, coro)`` runs ``coro`` in the background and parks it
+    under ``key``; ``take(key, text)`` hands the task over if it was started
+    for the same text and has not expired. Each key holds at most one
+    speculation: starting a new one, ``discard`` or expiry cancels the old.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def start(self, key, text, coro):
+        self.expire()
+        self.discard(key)
+        self.entries[key] = (text, asyncio.ensure_future(coro), time.time() + self.ttl)
+        metrics.incr("speculation.started")
+
+    def take(self, key, text):
+        self.expire()
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != text:
+            metrics.incr("speculation.misses")
+            return None
+        del self.entries[key]
+        metrics.incr("speculation.hits")
+        return entry[1]
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        task = entry[1]
+        if not task.done():
+            task.cancel()
+            metrics.incr("speculation.cancelled")
+        elif not task.cancelled():
+            task.exception()  # a failed speculation nobody took is not an error
+
+    def expire(self):
+        now = time.time()
+        for key in [key for key, (_, _, expires) in self.entries.items() if expires <= now]:
+            self.discard(key)
+            metrics.incr("speculation.expired")
+
+    def close(self):
+        for key in list(self.entries):
+            self.discard(key)
@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+import numpy as np
+
+DATA_DIR = os.getenv("RECAP_DATA_DIR", "data")
+
+
+def data_path(*parts):
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def safe_id(name):
+    """``name`` itself if it is a safe file name, otherwise a hash of it."""
+    if re.fullmatch(r"[A-Za-z0-9_-]{1,64}", name):
+        return name
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+
+history_record = np.dtype([
+    ("depth", "u1"),
+    ("row", "u4"),
+    ("time", "f8"),
+    ("time_last", "f8"),
+    ("ease_factor", "f8"),
+])
+
+
+class HistorySegment:
+    """Append-only file of packed review records evicted from node ring buffers."""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = open(path, "ab")
+        # Records spilled after ``offset`` belong to state that was never
+        # snapshotted; WAL replay spills them again.
+        self.file.truncate(min(offset, os.path.getsize(path)))
+
+    @property
+    def offset(self):
+        self.file.flush()
+        return self.file.tell()
+
+    def append(self, depth, row, time_, time_last, ease_factor):
+        record = np.array([(depth, row, time_, time_last, ease_factor)], dtype=history_record)
+        self.file.write(record.tobytes())
+
+    def read(self, depth, row):
+        self.file.flush()
+        records = np.fromfile(self.path, dtype=history_record)
+        return records[(records["depth"] == depth) & (records["row"] == row)]
+
+    def close(self):
+        self.file.close()
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log of graded update events."""
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.file = open(path, "a", encoding="utf-8")
+
+    def append(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def replay(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                offset += len(line)
+                yield record
+        # drop a torn write at the tail so new records start on a clean line
+        self.file.truncate(offset)
+
+    def truncate(self):
+        self.file.truncate(0)
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+
+def write_snapshot(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
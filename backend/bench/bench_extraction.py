@@ -0,0 +1,55 @@
+"""Compare the lxml extractor with the BeautifulSoup one on the saved pages in ``pages/``.
+
+    python bench/bench_extraction.py [--runs 20] [pages/*.html ...]
+
+For every page it prints the median time of both extractors, the length of
+the extracted content and how similar the two outputs are.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+from difflib import SequenceMatcher
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "app"))
+
+from extraction import extract_article_content, extract_article_content_soup  # noqa: E402
+
+
+def timed(extract, html, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = extract(html, "https://example.com/")
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*", default=sorted(glob.glob(os.path.join(here, "pages", "*.html"))))
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'page':<12}{'KB':>7}{'soup ms':>10}{'lxml ms':>10}{'speedup':>9}{'soup chars':>12}{'lxml chars':>12}{'similar':>9}  title")
+    total_soup = total_lxml = 0
+    for path in args.pages:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        old, old_ms = timed(extract_article_content_soup, html, args.runs)
+        new, new_ms = timed(extract_article_content, html, args.runs)
+        total_soup += old_ms
+        total_lxml += new_ms
+        similar = SequenceMatcher(None, old["content"], new["content"], autojunk=False).ratio()
+        print(
+            f"{os.path.basename(path):<12}{len(html) / 1024:>7.0f}{old_ms:>10.2f}{new_ms:>10.2f}{old_ms / new_ms:>8.1f}x"
+            f"{len(old['content']):>12}{len(new['content']):>12}{similar:>9.2f}  {'same' if old['title'] == new['title'] else 'differs'}"
+        )
+    print(f"{'total':<19}{total_soup:>10.2f}{total_lxml:>10.2f}{total_soup / total_lxml:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
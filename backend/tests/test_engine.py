@@ -0,0 +1,62 @@
+import asyncio
+import shutil
+from engine import MemoryEngine
+
+split_functions = [
+    lambda sentence: [((word, 1), 1.0) for word in sentence.split()],
+    lambda word: [((letter, 2), 0.5) for letter in word],
+    lambda letter: [],
+]
+
+
+def review_all(engine, sentences):
+    for i, sentence in enumerate(sentences):
+        asyncio.run(engine.review(sentence, 3 + i % 3))
+
+
+sentences = ["the cat sat", "a cat ran", "the dog sat", "dogs ran far", "the cat"]
+
+
+def test_clean_and_crash_recovery_match(tmp_path):
+    engine = MemoryEngine(split_functions, 0.5, directory=str(tmp_path / "live"))
+    review_all(engine, sentences)
+    # a crash leaves whatever reached the disk: the log tail, no final snapshot
+    shutil.copytree(tmp_path / "live", tmp_path / "crashed")
+    expected = engine.to_dict(now=1e10)
+    engine.close()
+
+    clean = MemoryEngine(split_functions, 0.5, directory=str(tmp_path / "live"))
+    crashed = MemoryEngine(split_functions, 0.5, directory=str(tmp_path / "crashed"))
+    assert clean.to_dict(now=1e10) == expected
+    assert crashed.to_dict(now=1e10) == expected
+    assert clean.seq == crashed.seq == len(sentences)
+    assert clean.pending == 0
+    assert crashed.pending == len(sentences)
+    clean.close()
+    crashed.close()
+
+
+def test_recovery_does_not_call_split_functions(tmp_path):
+    engine = MemoryEngine(split_functions, 0.5, directory=str(tmp_path))
+    review_all(engine, sentences)
+    engine.close()
+
+    def fail(item):
+        raise AssertionError(item)
+
+    recovered = MemoryEngine([fail] * 3, 0.5, directory=str(tmp_path))
+    assert "cat" in recovered.nodes[1]
+    recovered.close()
+
+
+def test_long_replay_is_snapshotted(tmp_path, monkeypatch):
+    engine = MemoryEngine(split_functions, 0.5, directory=str(tmp_path / "live"))
+    review_all(engine, sentences * 2)
+    shutil.copytree(tmp_path / "live", tmp_path / "crashed")
+    engine.close()
+
+    monkeypatch.setattr(MemoryEngine, "snapshot_every", 4)
+    crashed = MemoryEngine(split_functions, 0.5, directory=str(tmp_path / "crashed"))
+    assert crashed.pending == 0
+    assert (tmp_path / "crashed" / "wal.jsonl").stat().st_size == 0
+    crashed.close()
@@ -0,0 +1,28 @@
+from node_store import EdgeList
+
+
+def edges_of(row):
+    return [((f"item{row}-{i}", 1 + i % 2), 1.0 / (i + 1)) for i in range(row % 4)]
+
+
+def test_pack_unpack_round_trip():
+    edges = EdgeList()
+    for row in range(10):
+        edges.append(edges_of(row))
+    restored = EdgeList.unpack(edges.pack())
+    assert len(restored) == 10
+    assert [restored[row] for row in range(10)] == [edges_of(row) for row in range(10)]
+
+
+def test_repeated_snapshots_mix_packed_and_read_rows():
+    edges = EdgeList()
+    for row in range(10):
+        edges.append(edges_of(row))
+    for generation in range(4):
+        edges = EdgeList.unpack(edges.pack())
+        # read some packed rows, leave the runs in between packed, add new ones
+        for row in range(generation, len(edges), 3):
+            assert edges[row] == edges_of(row)
+        edges.append(edges_of(len(edges)))
+    restored = EdgeList.unpack(edges.pack())
+    assert [restored[row] for row in range(len(restored))] == [edges_of(row) for row in range(14)]
@@ -0,0 +1,50 @@
+import random
+import numpy as np
+from scheduler import DueQueue, Scheduler
+
+
+def test_due_returns_due_rows_earliest_first():
+    queue = DueQueue()
+    for row, time_next in enumerate([5.0, 1.0, 9.0, 3.0, 7.0]):
+        queue.schedule(row, time_next)
+    assert queue.due(6.0) == [(1.0, 1), (3.0, 3), (5.0, 0)]
+    assert queue.due(1.0) == []
+    assert queue.peek() == (1.0, 1)
+
+
+def test_schedule_moves_existing_rows():
+    queue = DueQueue()
+    for row in range(4):
+        queue.schedule(row, float(row))
+    queue.schedule(0, 10.0)
+    queue.schedule(3, -1.0)
+    assert len(queue) == 4
+    assert queue.due(100.0) == [(-1.0, 3), (1.0, 1), (2.0, 2), (10.0, 0)]
+
+
+def test_matches_sorted_reference():
+    rng = random.Random(7)
+    keys = np.array([rng.uniform(0, 100) for _ in range(50)])
+    queue = DueQueue.from_keys(keys)
+    reference = dict(enumerate(keys.tolist()))
+    for _ in range(500):
+        row = rng.randrange(80)
+        if row in reference and rng.random() < 0.2:
+            queue.remove(row)
+            del reference[row]
+        else:
+            reference[row] = rng.uniform(0, 100)
+            queue.schedule(row, reference[row])
+        before = rng.uniform(0, 100)
+        assert queue.due(before) == sorted((key, row) for row, key in reference.items() if key < before)
+    assert queue.peek() == min((key, row) for row, key in reference.items())
+
+
+def test_scheduler_earliest_across_depths():
+    scheduler = Scheduler(3)
+    assert scheduler.earliest() is None
+    scheduler.schedule(1, 0, 4.0)
+    scheduler.schedule(2, 0, 2.0)
+    assert scheduler.earliest() == 2.0
+    assert scheduler.due(1, 5.0) == [(4.0, 0)]
+    assert len(scheduler) == 2
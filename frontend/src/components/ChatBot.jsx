@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import ChatHistory from './ChatHistory';
 import ChatInput from './ChatInput';
 import WelcomeScreen from './WelcomeScreen';
+import { withLearner } from '../learner';
 import './ChatBot.css';
 
 const ChatBot = ({ selectedSubject }) => {
@@ -12,7 +13,7 @@ const ChatBot = ({ selectedSubject }) => {
     const loadChatHistory = async () => {
         try {
             console.log('从后端加载聊天历史记录...');
-            const response = await fetch('https://recap.apps.austinjiang.com/chat/history');
+            const response = await fetch(withLearner('https://recap.apps.austinjiang.com/chat/history'));
             
             if (response.ok) {
                 const data = await response.json();
@@ -43,7 +44,7 @@ const ChatBot = ({ selectedSubject }) => {
     const clearChatHistory = async () => {
         try {
             console.log('清除后端聊天记录...');
-            const response = await fetch('https://recap.apps.austinjiang.com/chat/clear', {
+            const response = await fetch(withLearner('https://recap.apps.austinjiang.com/chat/clear'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -74,7 +75,7 @@ const ChatBot = ({ selectedSubject }) => {
         try {
             console.log('测试连接到后端...');
 
-            const response = await fetch('https://recap.apps.austinjiang.com/chat', {
+            const response = await fetch(withLearner('https://recap.apps.austinjiang.com/chat'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -110,7 +111,7 @@ const ChatBot = ({ selectedSubject }) => {
         try {
             console.log('AI开启对话...');
 
-            const response = await fetch('https://recap.apps.austinjiang.com/chat', {
+            const response = await fetch(withLearner('https://recap.apps.austinjiang.com/chat'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -199,7 +200,8 @@ const ChatBot = ({ selectedSubject }) => {
                 controller.abort();
             }, 60000); // 60秒超时
 
-            const response = await fetch('https://recap.apps.austinjiang.com/chat', {
+            // 流式接口：先收到高亮词汇，再逐段收到回复
+            const response = await fetch(withLearner('https://recap.apps.austinjiang.com/chat/stream'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -211,28 +213,61 @@ const ChatBot = ({ selectedSubject }) => {
                 signal: controller.signal
             });
 
-            clearTimeout(timeoutId);
             console.log('HTTP响应状态:', response.status);
 
             if (!response.ok) {
+                clearTimeout(timeoutId);
                 const errorText = await response.text();
                 console.error('HTTP错误响应:', errorText);
                 throw new Error(`HTTP错误: ${response.status} ${response.statusText}\n${errorText}`);
             }
 
-            const data = await response.json();
-            console.log('收到数据:', data);
-
-            // 添加AI回复到历史记录
-            const aiMessage = {
-                id: Date.now() + 1,
-                text: data.output || '抱歉，我没有收到有效回复',
+            // 添加一条空的AI回复，收到片段后逐步填充
+            const aiMessageId = Date.now() + 1;
+            setMessages(prev => [...prev, {
+                id: aiMessageId,
+                text: '',
                 sender: 'ai',
                 timestamp: new Date(),
-                highlightWords: data.highlight_words || data.retention_queue || [] // 需要高亮的词汇
-            };
+                highlightWords: []
+            }]);
+            const updateAiMessage = (update) => setMessages(prev =>
+                prev.map(msg => msg.id === aiMessageId ? { ...msg, ...update(msg) } : msg)
+            );
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let finished = false;
+
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE 事件之间以空行分隔
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+
+                    if (event === 'meta') {
+                        updateAiMessage(() => ({ highlightWords: data.highlight_words || [] }));
+                    } else if (event === 'token') {
+                        setIsLoading(false);  // 收到第一个片段后即可显示
+                        updateAiMessage(msg => ({ text: msg.text + data.text }));
+                    } else if (event === 'done') {
+                        console.log('收到数据:', data);
+                        updateAiMessage(() => ({ text: data.output || '抱歉，我没有收到有效回复' }));
+                        finished = true;
+                    } else if (event === 'error') {
+                        throw new Error(`HTTP错误: 500 ${data.detail}`);
+                    }
+                }
+            }
 
-            setMessages(prev => [...prev, aiMessage]);
+            clearTimeout(timeoutId);
         } catch (error) {
             console.error('发送消息失败:', error);
 
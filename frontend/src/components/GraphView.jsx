@@ -2,6 +2,7 @@ import React, { useRef, useEffect, useState } from 'react';
 import GraphCanvas from './GraphCanvas';
 import GraphControls from './GraphControls';
 import RetentionGraph from './RetentionGraph';
+import { withLearner } from '../learner';
 import './GraphView.css';
 
 const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
@@ -36,7 +37,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
     useEffect(() => {
         if (!isArticleMode) {
             // 建立WebSocket连接用于英语学习模式的实时更新
-            const ws = new WebSocket("wss://recap.apps.austinjiang.com/ws/");
+            const ws = new WebSocket(withLearner("wss://recap.apps.austinjiang.com/ws/"));
             
             ws.onmessage = (event) => {
                 const data = JSON.parse(event.data);
@@ -71,7 +72,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
 
     const loadEnglishMemoryGraph = () => {
         // 首先调用query接口获取初始数据
-        fetch('https://recap.apps.austinjiang.com/query/')
+        fetch(withLearner('https://recap.apps.austinjiang.com/query/'))
             .then(res => res.json())
             .then(data => {
                 if (data && data.nodes && Array.isArray(data.nodes)) {
@@ -89,7 +90,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
         setIsLoadingArticleGraph(true);
         try {
             // 首先创建知识图谱
-            const createResponse = await fetch('https://recap.apps.austinjiang.com/article/create-knowledge-graph', {
+            const createResponse = await fetch(withLearner('https://recap.apps.austinjiang.com/article/create-knowledge-graph'), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -131,7 +132,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
 
         if (isArticleMode && articleData) {
             // 文章模式：更新文章记忆
-            fetch('https://recap.apps.austinjiang.com/article/update-memory', {
+            fetch(withLearner('https://recap.apps.austinjiang.com/article/update-memory'), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ 
@@ -152,7 +153,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
                 });
         } else {
             // 英语学习模式：更新英语记忆
-            fetch('https://recap.apps.austinjiang.com/update/', {
+            fetch(withLearner('https://recap.apps.austinjiang.com/update/'), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ sentence, grade: parseInt(grade) })
@@ -173,7 +174,7 @@ const GraphView = ({ onClose, isArticleMode = false, articleData = null }) => {
             loadArticleKnowledgeGraph();
         } else {
             // 英语学习模式：清除英语记忆
-            fetch('https://recap.apps.austinjiang.com/init/', { method: 'POST' })
+            fetch(withLearner('https://recap.apps.austinjiang.com/init/'), { method: 'POST' })
                 .catch(err => {
                     console.error('Clear error:', err);
                 });
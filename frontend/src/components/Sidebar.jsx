@@ -198,12 +198,88 @@ const Sidebar = ({ selectedSubject, onSubjectChange, currentView, onViewChange,
     }
   };
 
-  // 处理网址添加
+  // 爬取结果对应的文档，使用后端生成的智能标题
+  const urlDocument = (url, scrapedData, index = 0) => ({
+    id: `url_${Date.now()}_${index}`,
+    name: scrapedData.name, // 使用LLM生成的标题
+    icon: '🔗',
+    available: true,
+    description: `网址链接 - ${url}`,
+    type: 'url',
+    url: url,
+    articleData: scrapedData // 保存文章数据
+  });
+
+  // 批量导入网址，后端每完成一个网址就返回一行 JSON
+  const importUrls = async (urls, form) => {
+    setIsLoading(true);
+    const failed = [];
+
+    try {
+      const response = await fetch('https://recap.apps.austinjiang.com/scrape-urls', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ urls }),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || '爬取失败');
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines.filter(Boolean)) {
+          const result = JSON.parse(line);
+          if (!result.success) {
+            failed.push(`${result.url}: ${result.detail}`);
+            continue;
+          }
+
+          const newDocument = urlDocument(result.url, result, result.index);
+          await saveDocumentToBackend(newDocument);
+          setUploadedDocuments(prev => [...prev, newDocument]);
+        }
+      }
+
+      setShowUploadForm(false);
+      setShowUrlForm(false);
+      form.reset();
+
+      if (failed.length > 0) {
+        alert(`以下网址爬取失败:\n${failed.join('\n')}`);
+      }
+    } catch (error) {
+      console.error('批量导入网址失败:', error);
+      alert(`爬取失败: ${error.message}`);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  // 处理网址添加，多个网址时每行一个，批量导入
   const handleUrlSubmit = async (event) => {
     event.preventDefault();
     const formData = new FormData(event.target);
-    const url = formData.get('url');
+    const urls = (formData.get('url') || '').split(/\s+/).filter(Boolean);
 
+    if (urls.length > 1) {
+      await importUrls(urls, event.target);
+      return;
+    }
+
+    const url = urls[0];
     if (url) {
       setIsLoading(true);
 
@@ -223,17 +299,8 @@ const Sidebar = ({ selectedSubject, onSubjectChange, currentView, onViewChange,
 
         const scrapedData = await response.json();
 
-        // 添加到文档列表，使用后端生成的智能标题
-        const newDocument = {
-          id: `url_${Date.now()}`,
-          name: scrapedData.name, // 使用LLM生成的标题
-          icon: '🔗',
-          available: true,
-          description: `网址链接 - ${url}`,
-          type: 'url',
-          url: url,
-          articleData: scrapedData // 保存文章数据
-        };
+        // 添加到文档列表
+        const newDocument = urlDocument(url, scrapedData);
 
         // 保存到后端
         await saveDocumentToBackend(newDocument);
@@ -366,10 +433,10 @@ const Sidebar = ({ selectedSubject, onSubjectChange, currentView, onViewChange,
                                 {showUrlForm && (
                                   <div className="url-form-dropdown">
                                     <form onSubmit={handleUrlSubmit}>
-                                      <input
-                                        type="url"
+                                      <textarea
                                         name="url"
-                                        placeholder="输入网址链接"
+                                        rows={3}
+                                        placeholder="输入网址链接，多个网址每行一个"
                                         required
                                         className="url-input"
                                       />
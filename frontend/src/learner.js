@@ -0,0 +1,13 @@
+// 每个浏览器生成一个学习者ID，后端据此区分各自的记忆图谱和聊天记录
+const STORAGE_KEY = 'learnerId';
+
+export const getLearnerId = () => {
+    let learnerId = localStorage.getItem(STORAGE_KEY);
+    if (!learnerId) {
+        learnerId = crypto.randomUUID();
+        localStorage.setItem(STORAGE_KEY, learnerId);
+    }
+    return learnerId;
+};
+
+export const withLearner = (url) => `${url}?learner_id=${encodeURIComponent(getLearnerId())}`;